@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Benchmark each LibraryMaker stage against synthetic clips.
+
+Clips are generated locally with ffmpeg lavfi sources covering several
+durations, resolutions, interlaced and progressive video and dark
+intros. Each stage is timed separately and results are written as JSON
+so runs from different commits can be compared.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+
+from tubize.app.libraryoptions import LibraryOptions
+from tubize.libraryasset import LibraryAsset
+from tubize.librarymaker import LibraryMaker
+from tubize.videometainfo import VideoMetaInfo
+from tubize.utils import call
+
+MEDIA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media")
+
+# name, seconds, width, height, interlaced, dark intro seconds
+CLIPS = [
+    ("short_360p", 20, 640, 360, False, 0),
+    ("short_1080i", 20, 1920, 1080, True, 0),
+    ("dark_intro_720p", 60, 1280, 720, False, 30),
+    ("medium_1080p", 300, 1920, 1080, False, 0),
+    ("long_720i", 1200, 1280, 720, True, 10),
+]
+QUICK_CLIPS = ["short_360p", "short_1080i", "dark_intro_720p"]
+
+
+def generate_clip(name, seconds, width, height, interlaced, dark) -> str:
+    """Create a synthetic clip with a hard scene cut every 3 seconds."""
+    group = os.path.join(MEDIA_DIR, "bench")
+    filename = os.path.join(group, f"{name}.mp4")
+    if os.path.exists(filename):
+        return filename
+    os.makedirs(group, exist_ok=True)
+    rate = 60 if interlaced else 30
+    size = f"size={width}x{height}:rate={rate}"
+    graph = (f"testsrc2={size}:duration={seconds - dark},"
+             "hue=h='97*floor(t/3)':b='mod(floor(t/3),3)-1'")
+    if dark:
+        graph = (f"color=black:{size}:duration={dark}[d];{graph}[s];"
+                 "[d][s]concat=n=2:v=1:a=0")
+    encode = "-c:v libx264 -preset veryfast -pix_fmt yuv420p"
+    if interlaced:
+        graph += ",interlace"
+        encode += " -flags +ildct+ilme"
+    print(f"Generating {filename} ...")
+    call(f'ffmpeg -hide_banner -loglevel error -y -filter_complex "{graph}[out]" \
+        -map "[out]" {encode} "{filename}"')
+    return filename
+
+
+def timed(results, clip, stage, function, *args):
+    """Run `function` recording its wall time against clip and stage."""
+    start = time.time()
+    function(*args)
+    seconds = time.time() - start
+    results.append({"clip": clip, "stage": stage, "seconds": seconds})
+    print(f"  {stage:10} {seconds:8.2f}s")
+
+
+def make_library() -> LibraryMaker:
+    """Create a maker for the generated media with default options."""
+    options = LibraryOptions("Benchmark")
+    options.__dict__.update(
+        vars(options.parser.parse_args(["-i", MEDIA_DIR, "-force"])))
+    return LibraryMaker(options)
+
+
+def run(clips: []) -> []:
+    """Time each stage for every clip, then the catalog for all of them."""
+    results = []
+    assets = []
+    maker = make_library()
+    for clip in clips:
+        filename = generate_clip(*clip)
+        asset = LibraryAsset(filename)
+        shutil.rmtree(asset.preview_basedir, ignore_errors=True)
+        os.makedirs(asset.preview_basedir, exist_ok=True)
+        print(f"- {clip[0]}")
+        name = clip[0]
+        timed(results, name, "probe", lambda: VideoMetaInfo(filename).fps)
+        asset.attributes.load_cache()
+        asset.attributes.fps
+        timed(results, name, "thumbnail", maker.generate_thumbnail_file,
+              asset)
+        timed(results, name, "preview", maker.generate_animated_webp_file,
+              asset)
+        timed(results, name, "scenes", maker._analyse_scenes, asset)
+        maker.options.proxy_analysis = True
+        timed(results, name, "scenes_proxy", maker._analyse_scenes, asset)
+        timed(results, name, "thumbnail_proxy",
+              maker.generate_thumbnail_file, asset)
+        maker.options.proxy_analysis = False
+        maker.options.scrub_seek = "keyframe"
+        timed(results, name, "scrub_keyframe",
+              maker.generate_video_scrub_file, asset)
+        maker.options.scrub_seek = "decode"
+        timed(results, name, "scrub", maker.generate_video_scrub_file, asset)
+        timed(results, name, "vtt", maker.generate_vtt_file, asset)
+        maker.generate_meta_file(asset)
+        asset.updated = True
+        assets.append(asset)
+    catalog_filename = os.path.join(MEDIA_DIR, "catalog.json")
+    if os.path.exists(catalog_filename):
+        os.remove(catalog_filename)
+    print("- all")
+    timed(results, "all", "catalog", maker.create_catalog, catalog_filename,
+          assets)
+    return results
+
+
+def revision() -> str:
+    """Get the git commit being measured."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: [], baseline_filename: str) -> None:
+    """Print each stage time relative to a previous results file."""
+    with open(baseline_filename, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+    previous = {(r["clip"], r["stage"]): r["seconds"]
+                for r in baseline["results"]}
+    print(f"Compared to {baseline.get('commit', '')[:10]}")
+    for result in results:
+        key = (result["clip"], result["stage"])
+        if previous.get(key):
+            ratio = result["seconds"] / previous[key]
+            print(f"  {key[0]:16} {key[1]:10} {ratio:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-o',
+                        '--output',
+                        default="results.json",
+                        help='results file to write')
+    parser.add_argument('-c',
+                        '--compare',
+                        default=None,
+                        help='previous results file to compare against')
+    parser.add_argument('-q',
+                        '--quick',
+                        default=False,
+                        action='store_true',
+                        help='only run the short clips')
+    args = parser.parse_args()
+    clips = [c for c in CLIPS if not args.quick or c[0] in QUICK_CLIPS]
+    results = run(clips)
+    report = {
+        "commit": revision(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python": sys.version.split()[0],
+        "clips": [dict(zip(["name", "seconds", "width", "height",
+                            "interlaced", "dark_intro"], c)) for c in clips],
+        "results": results
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Wrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,9 @@
 import os
 import sys
 
+from tubize import metrics
 from tubize.librarymaker import LibraryMaker
+from tubize.librarywatcher import LibraryWatcher
 from tubize.app.libraryoptions import LibraryOptions
 
 
@@ -15,10 +17,16 @@ def main() -> []:
     """
     options = LibraryOptions("Library creation options").parse()
     maker = LibraryMaker(options)
-    if os.path.isdir(options.entry_path):
+    if os.path.isdir(options.entry_path) and options.watch:
+        LibraryWatcher(maker, options.entry_path).run()
+    elif os.path.isdir(options.entry_path):
         videos = maker.add_directory(options.entry_path)
         catalog_file = os.path.join(options.entry_path, "catalog.json")
         maker.create_catalog(catalog_file, videos)
+        if options.metrics_out:
+            metrics.write_metrics(options.metrics_out)
+            trace_file = os.path.splitext(options.metrics_out)[0]
+            metrics.write_trace(f"{trace_file}.trace.json")
         return videos
     else:
         print("Expected directory path!", sys.stderr)
@@ -4,6 +4,7 @@ import argparse
 import logging
 
 from tubize.options import Options
+from tubize.utils import parse_thread_profiles
 
 
 class LibraryOptions(Options):
@@ -30,6 +31,82 @@ class LibraryOptions(Options):
                                  default=160,
                                  required=False,
                                  help='video preview tile pixel width')
+        self.parser.add_argument('-j',
+                                 '--jobs',
+                                 metavar='jobs',
+                                 type=int,
+                                 default=1,
+                                 required=False,
+                                 help='videos to process in parallel')
+        self.parser.add_argument('-cpu',
+                                 '--cpu-budget',
+                                 metavar='cpu_budget',
+                                 type=int,
+                                 default=0,
+                                 required=False,
+                                 help='cores shared by the jobs (0=all)')
+        self.parser.add_argument('-tp',
+                                 '--thread-profiles',
+                                 metavar='thread_profiles',
+                                 type=parse_thread_profiles,
+                                 default={},
+                                 required=False,
+                                 help='ffmpeg threads per command kind e.g. '
+                                 'decode=2,encode=1,transcode=0 '
+                                 '(0=the job budget)')
+        self.parser.add_argument('-m',
+                                 '--metrics-out',
+                                 metavar='metrics_out',
+                                 type=str,
+                                 default=None,
+                                 required=False,
+                                 help='write stage timings and a chrome trace')
+        self.parser.add_argument('-sk',
+                                 '--scrub-seek',
+                                 dest='scrub_seek',
+                                 choices=['decode', 'exact', 'keyframe'],
+                                 default='decode',
+                                 required=False,
+                                 help='scrub frames from a full decode, an '
+                                 'exact seek or the nearest keyframe')
+        self.parser.add_argument('-sps',
+                                 '--scrub-page-size',
+                                 metavar='scrub_page_size',
+                                 type=int,
+                                 default=0,
+                                 required=False,
+                                 help='page scrub tiles over sheets of at '
+                                 'most this many pixels a side (0 disables)')
+        self.parser.add_argument('-spb',
+                                 '--scrub-page-bytes',
+                                 metavar='scrub_page_bytes',
+                                 type=int,
+                                 default=0,
+                                 required=False,
+                                 help='lower scrub sheet quality to stay '
+                                 'within this many bytes (0 disables)')
+        self.parser.add_argument('-sl',
+                                 '--segment-length',
+                                 metavar='segment_length',
+                                 type=int,
+                                 default=600,
+                                 required=False,
+                                 help='seconds per segment analysed in '
+                                 'parallel (0 disables)')
+        self.parser.add_argument('-pi',
+                                 '--poll-interval',
+                                 metavar='poll_interval',
+                                 type=float,
+                                 default=60,
+                                 required=False,
+                                 help='seconds between watch mode scans')
+        self.parser.add_argument('-st',
+                                 '--settle-time',
+                                 metavar='settle_time',
+                                 type=float,
+                                 default=10,
+                                 required=False,
+                                 help='seconds a video must be unchanged')
         self.parser.add_argument('-force',
                                  '--force',
                                  dest='force',
@@ -37,6 +114,59 @@ class LibraryOptions(Options):
                                  required=False,
                                  action='store_true',
                                  help='force create even if file exists')
+        self.parser.add_argument('-ic',
+                                 '--incremental-catalog',
+                                 dest='incremental',
+                                 default=False,
+                                 required=False,
+                                 action='store_true',
+                                 help='update the existing catalog in place')
+        self.parser.add_argument('-sc',
+                                 '--sharded-catalog',
+                                 dest='sharded',
+                                 default=False,
+                                 required=False,
+                                 action='store_true',
+                                 help='write a root index and a catalog '
+                                 'shard per group')
+        self.parser.add_argument('-pc',
+                                 '--precompress',
+                                 dest='precompress',
+                                 default=False,
+                                 required=False,
+                                 action='store_true',
+                                 help='also write .gz (and .br) variants of '
+                                 'the catalog, meta and vtt files')
+        self.parser.add_argument('-mn',
+                                 '--minify',
+                                 dest='minify',
+                                 default=False,
+                                 required=False,
+                                 action='store_true',
+                                 help='write compact catalog, meta and vtt '
+                                 'files')
+        self.parser.add_argument('-pa',
+                                 '--proxy-analysis',
+                                 dest='proxy_analysis',
+                                 default=False,
+                                 required=False,
+                                 action='store_true',
+                                 help='score scenes and thumbnails on '
+                                 'cheaply decoded small frames')
+        self.parser.add_argument('-watch',
+                                 '--watch',
+                                 dest='watch',
+                                 default=False,
+                                 required=False,
+                                 action='store_true',
+                                 help='keep updating as videos change')
+        self.parser.add_argument('-sd',
+                                 '--shared-decode',
+                                 dest='shared_decode',
+                                 default=False,
+                                 required=False,
+                                 action='store_true',
+                                 help='create artifacts from a single decode')
         self.parser.add_argument('-nt',
                                  '--no-thumbnail',
                                  dest='thumb',
@@ -6,6 +6,8 @@ import sys
 import json
 from pathlib import Path
 
+from tubize.libraryrename import LibraryRename
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
@@ -55,7 +57,16 @@ if __name__ == "__main__":
         os.remove(catalog_existing)
         os.rename(catalog_existing + "_", catalog_existing)
         logger.debug(f"Updated {catalog_existing} contents")
-    if mode == "p":
+    elif mode == "t":
+        renamer = LibraryRename(sys.argv[2])
+        if sys.argv[3] == "--resume":
+            renamer.apply()
+        elif sys.argv[3] == "--rollback":
+            renamer.rollback()
+        else:
+            renamer.plan(sys.argv[3], sys.argv[4])
+            renamer.apply()
+    elif mode == "p":
         source = sys.argv[2]
         preview = source + "/../preview"
         if not os.path.exists(preview):
@@ -74,3 +85,5 @@ if __name__ == "__main__":
     else:
         print("prune -- rename.py p [video_source_path]")
         print("rename -- rename.py r [video_root] [match] [replace]")
+        print("catalog rename -- rename.py t [video_root] [match] [replace]")
+        print("resume/undo -- rename.py t [video_root] --resume|--rollback")
@@ -0,0 +1,50 @@
+"""
+Scores batches of decoded video frames.
+
+Frames are stacked as a (n, height, width, 3) BGR uint8 array so a whole
+batch of candidates is scored with a few vectorized numpy operations.
+"""
+import collections
+import numpy as np
+
+Scores = collections.namedtuple(
+    'Scores', 'flat flatness brightness sharpness')
+
+# Frames are subsampled to about this width before scoring
+SCORE_WIDTH = 160
+# Luma distance from the median counting a pixel as part of the flat area
+FLAT_LUMA_RANGE = 12
+# Share of flat area, or minimum detail, above which a frame is flat
+FLAT_LIMIT = 0.85
+SHARP_LIMIT = 2.0
+
+
+def score_frames(frames: np.ndarray) -> Scores:
+    """
+    Score each frame of `frames` returning arrays of:
+
+    * flat - True if the frame is feature-less (e.g. black, fade, title)
+    * flatness - share of pixels close to the frame median luma (0-1)
+    * brightness - mean luma (0-1)
+    * sharpness - mean absolute laplacian of the luma
+    """
+    frames = np.asarray(frames)
+    if frames.ndim == 3:
+        frames = frames[np.newaxis]
+    step = max(1, frames.shape[2] // SCORE_WIDTH)
+    frames = frames[:, ::step, ::step].astype(np.float32)
+    luma = (0.114 * frames[..., 0] + 0.587 * frames[..., 1] +
+            0.299 * frames[..., 2])
+    median = np.median(luma, axis=(1, 2))
+    flatness = np.mean(
+        np.abs(luma - median[:, np.newaxis, np.newaxis]) < FLAT_LUMA_RANGE,
+        axis=(1, 2))
+    brightness = luma.mean(axis=(1, 2)) / 255.0
+    laplacian = (4 * luma[:, 1:-1, 1:-1] - luma[:, :-2, 1:-1] -
+                 luma[:, 2:, 1:-1] - luma[:, 1:-1, :-2] - luma[:, 1:-1, 2:])
+    sharpness = np.abs(laplacian).mean(axis=(1, 2))
+    flat = (flatness > FLAT_LIMIT) | (sharpness < SHARP_LIMIT)
+    return Scores(flat=flat,
+                  flatness=flatness,
+                  brightness=brightness,
+                  sharpness=sharpness)
@@ -16,15 +16,23 @@ class LibraryAsset:
         self.updated = False
         self._attributes = None
 
+    @classmethod
+    def from_meta_filename(cls, meta_filename):
+        """Get the asset a preview meta file was written for."""
+        preview_dir, name = os.path.split(meta_filename[:-len(".json")])
+        preview_root, group = os.path.split(preview_dir)
+        return cls(os.path.join(os.path.dirname(preview_root), group, name))
+
     def acquire_attributes(self):
         """Process video to get meta data attributes from stream."""
-        self.attributes = VideoMetaInfo(self.filename)
+        self._attributes = VideoMetaInfo(self.filename, self.meta_filename)
 
     @property
     def attributes(self):
         """Get attributes ondemand."""
         if not self._attributes:
-            self._attributes = VideoMetaInfo(self.filename)
+            self._attributes = VideoMetaInfo(self.filename,
+                                             self.meta_filename)
         return self._attributes
 
     @property
@@ -74,16 +82,52 @@ class LibraryAsset:
         """Get uri path for scrub image."""
         return os.path.basename(self.scrub_image_filename)
 
+    def scrub_page_filename(self, page: int) -> str:
+        """Get scrub sprite sheet `page`, the first being the scrub image."""
+        if not page:
+            return self.scrub_image_filename
+        return f"{self.preview_basename}.{page}.jpg"
+
+    def scrub_page_uri(self, page: int) -> str:
+        """Get uri path for scrub sprite sheet `page`."""
+        return os.path.basename(self.scrub_page_filename(page))
+
+    @property
+    def scrub_pages(self) -> int:
+        """Count the scrub sprite sheets written for the video."""
+        pages = 0
+        while os.path.exists(self.scrub_page_filename(pages)):
+            pages += 1
+        return pages
+
     @property
     def meta_filename(self):
         """Get meta for file."""
         return self.preview_basename + ".json"
 
+    @property
+    def scenes_filename(self):
+        """Get scene score timeline for file."""
+        return self.preview_basename + ".scenes.json"
+
+    @property
+    def manifest_filename(self):
+        """Get the record of what each preview file was built from."""
+        return self.preview_basename + ".build.json"
+
     @property
     def vtt_filename(self):
         """Get meta for file."""
         return self.preview_basename + ".vtt"
 
+    @property
+    def artifact_filenames(self):
+        """Get preview files generated from the video content."""
+        return [
+            self.tile_image_filename, self.webp_filename,
+            self.scrub_image_filename, self.vtt_filename
+        ] + [self.scrub_page_filename(p) for p in range(1, self.scrub_pages)]
+
     @property
     def group(self):
         """Extract group from filename."""
@@ -1,7 +1,11 @@
 import os
 import json
+import concurrent.futures
 
 from .libraryasset import LibraryAsset
+from .utils import write_atomic, dump_json, PRECOMPRESSED_EXTS
+
+SHARD_DIR = ".catalog"
 
 
 class LibraryCatalog(dict):
@@ -10,44 +14,245 @@ class LibraryCatalog(dict):
         """Poor wrapper around list."""
         super().__init__()
         self.groups = {}
+        self.members = {}
         self.total_file_size = 0
         self.total_duration = 0
+        self.changed = set()
+        self.sharded = False
+        self.order = []
 
     def append(self, asset: LibraryAsset):
         """Add video asset to grouping."""
-        group = asset.group
-        if group not in self.groups:
-            self.groups[group] = {'assets': [], 'time': 0}
-        group = self.groups[group]
-        group['assets'].append(asset)
-
-    def update_group_thumbnails(self, tile_function, output_filename, updates):
-        """Create group thumbnail."""
-        for name, g in self.groups.items():
+        self.members.setdefault(asset.group, []).append(asset)
+
+    @staticmethod
+    def entry(asset: LibraryAsset) -> {}:
+        """Create the catalog entry describing an asset."""
+        return {
+            '_': asset.uri,
+            'title': asset.attributes.title,
+            'description': asset.attributes.description,
+            'tags': asset.attributes.keywords,
+            'duration': asset.attributes.duration,
+            'size': os.path.getsize(asset.filename)
+        }
+
+    def _group(self, name: str) -> {}:
+        """Get group `name` creating it if missing."""
+        if name not in self.groups:
+            self.groups[name] = {'assets': [], 'time': 0, 'size': 0}
+        return self.groups[name]
+
+    def _count(self, group: {}, entry: {}, sign: int = 1):
+        """Add (or remove) an entry from the group and catalog totals."""
+        group['time'] += sign * entry['duration']
+        group['size'] += sign * entry['size']
+        self.total_duration += sign * entry['duration']
+        self.total_file_size += sign * entry['size']
+
+    def build(self):
+        """Create entries for every appended asset."""
+        for name, assets in self.members.items():
+            self.changed.add(name)
+            group = self._group(name)
+            for asset in assets:
+                entry = self.entry(asset)
+                group['assets'].append(entry)
+                self._count(group, entry)
+
+    def load(self, filename: str) -> bool:
+        """
+        Load groups and totals from an existing catalog file. False if
+        missing or written without the per asset sizes needed to update.
+        """
+        if not os.path.exists(filename):
+            return False
+        with open(filename, "r") as cat_file:
+            groups = json.load(cat_file)
+        for name, group in groups.items():
+            if 'shard' in group:
+                shard_filename = self.shard_filename(filename, name)
+                if not os.path.exists(shard_filename):
+                    return False
+                with open(shard_filename, "r") as shard_file:
+                    group['assets'] = json.load(shard_file)
+                del group['shard'], group['count']
+                self.sharded = True
+            if any('size' not in entry for entry in group['assets']):
+                return False
+        self.groups = groups
+        self.order = list(groups)
+        for group in self.groups.values():
+            group['time'] = sum(e['duration'] for e in group['assets'])
+            group['size'] = sum(e['size'] for e in group['assets'])
+            self.total_duration += group['time']
+            self.total_file_size += group['size']
+        return True
+
+    def update(self) -> int:
+        """
+        Apply the added, changed and removed appended assets to the
+        loaded groups. Only new or updated assets are inspected.
+        Returns the number of changes.
+        """
+        changes = 0
+        for name in [n for n in self.groups if n not in self.members]:
+            self.changed.add(name)
+            for entry in self.groups.pop(name)['assets']:
+                self.total_duration -= entry['duration']
+                self.total_file_size -= entry['size']
+                changes += 1
+        for name, assets in self.members.items():
+            group = self._group(name)
+            index = {e['_']: i for i, e in enumerate(group['assets'])}
+            added = False
+            for asset in assets:
+                i = index.pop(asset.uri, None)
+                if i is None:
+                    entry = self.entry(asset)
+                    group['assets'].append(entry)
+                    added = True
+                elif asset.updated:
+                    self._count(group, group['assets'][i], -1)
+                    entry = self.entry(asset)
+                    group['assets'][i] = entry
+                else:
+                    continue
+                self._count(group, entry)
+                self.changed.add(name)
+                changes += 1
+            if index:
+                self.changed.add(name)
+                for i in index.values():
+                    self._count(group, group['assets'][i], -1)
+                    changes += 1
+                removed = set(index)
+                group['assets'] = [
+                    e for e in group['assets'] if e['_'] not in removed
+                ]
+            if added:
+                group['assets'].sort(key=lambda e: e['_'])
+        return changes
+
+    def rename(self, uri: str, asset: LibraryAsset) -> None:
+        """Move the entry for `uri` to the renamed video `asset`."""
+        name = uri.split("/")[0]
+        group = self.groups[name]
+        entry = next(e for e in group['assets'] if e['_'] == uri)
+        group['assets'].remove(entry)
+        self._count(group, entry, -1)
+        self.changed.update([name, asset.group])
+        if not group['assets']:
+            del self.groups[name]
+        entry.update({
+            '_': asset.uri,
+            'title': asset.attributes.title,
+            'description': asset.attributes.description,
+            'tags': asset.attributes.keywords
+        })
+        if asset.group not in self.groups:
+            self._group(asset.group)
+            # A group emptied and re-created keeps its loaded position
+            position = {n: i for i, n in enumerate(self.order)}
+            names = sorted(self.groups,
+                           key=lambda n: position.get(n, len(position)))
+            self.groups = {n: self.groups[n] for n in names}
+        group = self.groups[asset.group]
+        group['assets'].append(entry)
+        group['assets'].sort(key=lambda e: e['_'])
+        self._count(group, entry)
+
+    def update_group_thumbnails(self,
+                                tile_function,
+                                output_filename,
+                                stale,
+                                jobs: int = 1) -> []:
+        """
+        Create the group thumbnails that are missing or for which
+        `stale(name, files)` is true, composing `jobs` groups at a time.
+        Returns the names of the groups updated.
+        """
+        tiles = {}
+        for name, assets in self.members.items():
+            fname = f'{os.path.dirname(output_filename)}/{name}.jpg'
+            files = [f.tile_image_filename for f in assets]
+            if stale(name, files) or not os.path.exists(fname):
+                tiles[name] = (files, fname)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, jobs)) as executor:
+            for _ in executor.map(lambda tile: tile_function(*tile),
+                                  tiles.values()):
+                pass
+        for name in self.members:
             fname = f'{os.path.dirname(output_filename)}/{name}.jpg'
-            if not os.path.exists(fname) or updates:
-                files = [f.tile_image_filename for f in g['assets']]
-                tile_function(files, fname)
-                g['thumbnail'] = fname
+            if name in self.groups and os.path.exists(fname):
+                self.groups[name]['thumbnail'] = fname
+        return list(tiles)
 
-    def to_json(self):
+    def to_json(self, minify: bool = False):
         """Emit a JSON description of structure."""
-        for group in self.groups.values():
-            for asset in group['assets']:
-                group['time'] += asset.attributes.duration
-                self.total_file_size += os.path.getsize(asset.filename)
-                self.total_duration += asset.attributes.duration
-
-        def serialize(obj):
-            """Serialize data."""
-            if isinstance(obj, LibraryAsset):
-                return {
-                    '_': obj.uri,
-                    'title': obj.attributes.title,
-                    'description': obj.attributes.description,
-                    'tags': obj.attributes.keywords,
-                    'duration': obj.attributes.duration
-                }
-            return obj.__dict__
-
-        return json.dumps(self.groups, default=serialize, indent=2)
+        return dump_json(self.groups, minify)
+
+    @staticmethod
+    def shard_dirname(filename: str) -> str:
+        """Get the directory of the shards for the root index `filename`."""
+        return os.path.join(os.path.dirname(filename), SHARD_DIR)
+
+    @staticmethod
+    def shard_filename(filename: str, name: str) -> str:
+        """Get the shard of group `name` for the root index `filename`."""
+        return os.path.join(LibraryCatalog.shard_dirname(filename),
+                            f"{name}.json")
+
+    def shard_json(self, name: str) -> str:
+        """Emit the compact JSON assets of group `name`."""
+        return dump_json(self.groups[name]['assets'], minify=True)
+
+    def index_json(self, minify: bool = False) -> str:
+        """Emit the root index summarising each group and its shard."""
+        index = {}
+        for name, group in self.groups.items():
+            index[name] = {
+                'count': len(group['assets']),
+                'time': group['time'],
+                'size': group['size'],
+                'shard': f"{SHARD_DIR}/{name}.json"
+            }
+            if 'thumbnail' in group:
+                index[name]['thumbnail'] = group['thumbnail']
+        return dump_json(index, minify)
+
+    def write_shards(self, filename: str) -> int:
+        """
+        Write the shards of changed (or missing) groups for the root index
+        `filename`, skipping any whose contents are unchanged. Returns
+        the number of shards written.
+        """
+        written = 0
+        os.makedirs(self.shard_dirname(filename), exist_ok=True)
+        for name in self.groups:
+            shard_filename = self.shard_filename(filename, name)
+            exists = os.path.exists(shard_filename)
+            if exists and name not in self.changed:
+                continue
+            data = self.shard_json(name)
+            if exists:
+                with open(shard_filename, "r") as shard_file:
+                    if shard_file.read() == data:
+                        continue
+            write_atomic(shard_filename, data)
+            written += 1
+        return written
+
+    def prune_shards(self, filename: str, keep: bool = True) -> None:
+        """Remove the shards (and their variants) of groups no longer in
+        the catalog, or every shard and their directory unless `keep`."""
+        shard_dir = self.shard_dirname(filename)
+        if os.path.isdir(shard_dir):
+            for shard in os.listdir(shard_dir):
+                name, ext, variant = shard.rpartition(".json")
+                if (ext and variant in ("", *PRECOMPRESSED_EXTS)
+                        and (not keep or name not in self.groups)):
+                    os.remove(os.path.join(shard_dir, shard))
+            if not keep and not os.listdir(shard_dir):
+                os.rmdir(shard_dir)
@@ -0,0 +1,138 @@
+"""
+Index the content fingerprints of the videos previewed in a library.
+
+The index is a json lines file under `<root>/.preview/` that workers
+append to as they write meta files, so finding a renamed or duplicate
+video never has to crawl the library. Libraries previewed before the
+index existed are crawled once to build it.
+"""
+import os
+import json
+import logging
+
+from .utils import write_atomic
+
+INDEX_FILENAME = "fingerprints.jsonl"
+
+log = logging.getLogger(__name__)
+
+
+class FingerprintIndex:
+    """Persistent map of content fingerprints to preview meta files."""
+    def __init__(self, root: str):
+        self.root = root
+        self.filename = os.path.join(root, ".preview", INDEX_FILENAME)
+        self._entries = {}
+        self._offset = 0
+
+    def build(self) -> int:
+        """
+        Write the index from the meta files under the root unless it
+        already exists, when it is compacted instead. Returns the number
+        of videos crawled.
+        """
+        if os.path.exists(self.filename):
+            self.compact()
+            return 0
+        lines = []
+        for path, dirs, files in os.walk(self.root):
+            dirs[:] = sorted(d for d in dirs
+                             if d[0] != "." or d == ".preview")
+            if ".preview" not in path.split(os.path.sep):
+                continue
+            for name in sorted(files):
+                if not name.endswith(".json") or name.endswith(
+                    (".scenes.json", ".build.json")):
+                    continue
+                filename = os.path.join(path, name)
+                try:
+                    with open(filename, "r") as meta_file:
+                        meta = json.load(meta_file)
+                except (ValueError, OSError):
+                    continue
+                if isinstance(meta, dict) and "fingerprint" in meta:
+                    lines.append(self._line(meta["fingerprint"], filename))
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        write_atomic(self.filename, "".join(lines))
+        log.debug("Indexed %d fingerprints in %s", len(lines), self.filename)
+        return len(lines)
+
+    def compact(self) -> int:
+        """
+        Rewrite the index keeping only the last entry of each meta file
+        still present, as appends leave repeated and stale entries.
+        Returns the number of entries dropped.
+        """
+        try:
+            with open(self.filename, "rb") as index_file:
+                data = index_file.read()
+        except OSError:
+            return 0
+        lines = data.splitlines()
+        latest = {}
+        for line in lines:
+            try:
+                fingerprint, relative = json.loads(line)
+            except ValueError:
+                continue
+            # Re-added videos supersede their earlier fingerprint
+            latest.pop(relative, None)
+            latest[relative] = fingerprint
+        self._entries = {}
+        kept = []
+        for relative, fingerprint in latest.items():
+            if os.path.exists(os.path.join(self.root, relative)):
+                self._entries.setdefault(fingerprint, []).append(relative)
+                kept.append(json.dumps([fingerprint, relative]) + "\n")
+        if len(kept) < len(lines):
+            write_atomic(self.filename, "".join(kept))
+            log.debug("Compacted %d fingerprints in %s",
+                      len(lines) - len(kept), self.filename)
+        self._offset = os.path.getsize(self.filename)
+        return len(lines) - len(kept)
+
+    def _line(self, fingerprint: str, meta_filename: str) -> str:
+        relative = os.path.relpath(meta_filename, self.root)
+        return json.dumps([fingerprint, relative]) + "\n"
+
+    def refresh(self) -> None:
+        """Read the entries appended since the index was last read."""
+        try:
+            with open(self.filename, "rb") as index_file:
+                index_file.seek(self._offset)
+                data = index_file.read()
+        except OSError:
+            return
+        # A line still being appended is read next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                fingerprint, relative = json.loads(line)
+            except ValueError:
+                continue
+            candidates = self._entries.setdefault(fingerprint, [])
+            if relative not in candidates:
+                candidates.append(relative)
+        self._offset += end
+
+    def find(self, fingerprint: str) -> []:
+        """Get the meta files indexed for `fingerprint`."""
+        if fingerprint not in self._entries:
+            self.refresh()
+        return [
+            os.path.join(self.root, relative)
+            for relative in self._entries.get(fingerprint, [])
+        ]
+
+    def add(self, fingerprint: str, meta_filename: str) -> None:
+        """Append the meta file of a video previewed with `fingerprint`."""
+        line = self._line(fingerprint, meta_filename)
+        relative = json.loads(line)[1]
+        candidates = self._entries.setdefault(fingerprint, [])
+        if relative in candidates:
+            return
+        candidates.append(relative)
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        # Single line appends are not interleaved between workers
+        with open(self.filename, "a") as index_file:
+            index_file.write(line)
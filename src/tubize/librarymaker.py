@@ -5,34 +5,96 @@ Extracts a thumbnail, animated preview of interesting scenes
 and a scrub sprite for video track scrubbing, along with VTT description.
 """
 import os
+import io
+import json
+import hashlib
 import collections
+import contextlib
+import concurrent.futures
 import logging
 import tempfile
 import time
 import math
+import re
 import numpy as np
-import imutils
 import cv2
 
 from .options import Options
 from .libraryasset import LibraryAsset
 from .librarycatalog import LibraryCatalog
-from .utils import sizeof_fmt, time_fmt, find_files, check_dependencies, call, ffmpeg
+from .libraryfingerprints import FingerprintIndex
+from .framescore import score_frames, SCORE_WIDTH
+from .mosaic import ThumbnailCache, write_mosaic, MOSAIC_WIDTH, MOSAIC_HEIGHT, MOSAIC_DIM, MOSAIC_QUALITY
+from . import metrics
+from .utils import FFMPEG, sizeof_fmt, time_fmt, walk_files, check_dependencies, call, ffmpeg, file_signature, write_atomic, check_ffmpeg_encoders, link_or_copy, ffmpeg_many, set_call_limit, set_thread_profiles, threaded_args, precompress, dump_json, PRECOMPRESSED_EXTS
 
 log = logging.getLogger(__name__)
 
+# Maker of a worker process, set by _init_worker
+_WORKER = {}
+
+THUMBNAIL_BATCH = 16
+SCRUB_BATCH = 32
+START_OFFSET = 4
+SEGMENT_OVERLAP = 1
+PREVIEW_DELAY = 210
+# Proxy analysis frame width, scaled horizontally only so the rows of
+# each field survive for the deinterlacer
+ANALYSIS_WIDTH = 320
+PROXY_DECODE = "-skip_loop_filter all"
+# Scene frames closer than this share a decode window starting this
+# long before the first
+SCENE_WINDOW_GAP = 2
+SCENE_WINDOW_LEAD = 0.5
+# Scene decode windows per ffmpeg command
+SCENE_BATCH = 32
+WEBP_ENCODER = "-vsync vfr -c:v libwebp_anim -lossless 0 -q:v 75 -loop 0"
+# First frame of every second, on the timeline rather than by frame count
+# so non integer frame rates (e.g. 29.97) keep to the scrub sample times
+SCRUB_SELECT = "select='isnan(prev_selected_t)+gt(floor(t),floor(prev_selected_t))'"
+
+
+def _init_worker(maker) -> None:
+    """Keep a maker per worker process so it is only sent once."""
+    _WORKER["maker"] = maker
+    # Share the core budget between the jobs
+    maker.set_thread_budget(maker.options.jobs)
+    metrics.collect()
+
+
+def _add_video_job(filename: str) -> (LibraryAsset, str, []):
+    """Process a video in a worker, capturing its console output and
+    timing spans."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        asset = _WORKER["maker"].add_video(filename)
+    return asset, output.getvalue(), metrics.collect()
+
 
 class LibraryMaker:
     """Coordinates the aggregation of videos and creation of preview artifacts"""
     def __init__(self, options: Options):
         self.options = options
         self.preview_width = self.options.preview_width
+        self._fingerprints = None
+        self._thumbnails = ThumbnailCache()
+        self.set_thread_budget()
         external_deps = {
             "ffmpeg": "ffmpeg -version",
-            "mediainfo": "mediainfo --version",
-            "img2webp": "img2webp -version"
+            "ffprobe": "ffprobe -version"
         }
         check_dependencies(external_deps)
+        check_ffmpeg_encoders(["libwebp_anim"])
+
+    def set_thread_budget(self, jobs: int = 1) -> None:
+        """
+        Give this process its share of the host core budget and the
+        configured threads per resource profile, so ffmpeg commands are
+        packed onto the cores without oversubscribing them.
+        """
+        budget = self.options.cpu_budget or os.cpu_count() or 1
+        set_call_limit(max(1, budget // jobs))
+        set_thread_profiles(self.options.thread_profiles)
 
     def _step(self, cur_state, count: int) -> bool:
         """Seek to next scene change factor to get desired frame count."""
@@ -52,155 +114,810 @@ class LibraryMaker:
 
     def _time_code(self, duration: int) -> str:
         """Create timecode for a given duration in milliseconds."""
-        milliseconds = int((duration % 1000) / 100)
+        milliseconds = int(duration % 1000)
         seconds = math.floor((duration / 1000) % 60)
         minutes = math.floor((duration / (1000 * 60)) % 60)
         hours = math.floor((duration / (1000 * 60 * 60)) % 24)
         return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
 
-    def _get_scenes(self, asset: LibraryAsset, step: int, tmp) -> ([], int):
-        """Extract scenes from video file into `tmp` directory."""
+    def _segments(self, asset: LibraryAsset) -> []:
+        """
+        Split the video after the 4sec mark into (start, length) second
+        ranges analysed in parallel, the last running to the end.
+        """
+        length = self.options.segment_length
+        span = asset.attributes.duration - START_OFFSET
+        if length <= 0 or span <= length:
+            return [(0, None)]
+        starts = list(range(0, span, length))
+        return [(start, length)
+                for start in starts[:-1]] + [(starts[-1], None)]
+
+    def _segment_input(self,
+                       asset: LibraryAsset,
+                       start: int,
+                       length: int,
+                       analysis: bool = False) -> (str, str, int):
+        """
+        Get the input arguments and trim filter for a segment, with the
+        offset of its frame times. Decoding starts a second early so the
+        deinterlacer and scene scores see the frames before the segment,
+        which the trim then drops. Inputs only decoded for `analysis`
+        may use the proxy decoder options.
+        """
+        overlap = min(SEGMENT_OVERLAP, start)
+        end = ""
+        duration = ""
+        if length is not None:
+            end = f":end={overlap + length}"
+            duration = f"-t {overlap + length + 1} "
+        if analysis and self.options.proxy_analysis:
+            duration += f"{PROXY_DECODE} "
+        return (f'-ss {START_OFFSET + start - overlap} {duration}'
+                f'-i "{asset.filename}"', f"trim=start={overlap}{end}",
+                start - overlap)
+
+    def _analysis_filter(self) -> str:
+        """
+        Get the deinterlace filter frames are analysed through, shrinking
+        them first in proxy analysis mode.
+        """
+        if self.options.proxy_analysis:
+            return (f"scale='min(iw,{ANALYSIS_WIDTH})':ih:flags=area,"
+                    "yadif=1")
+        return "yadif=1"
+
+    def _run_segments(self, args: [], binary: bool = False) -> []:
+        """Run the ffmpeg commands of each segment in parallel."""
+        results = ffmpeg_many(args, binary=binary)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+            if result.returncode:
+                log.warning("Segment failed %s", result.stderr)
+        return results
+
+    def _scene_filter(self, step: int) -> str:
+        """Select scene frames at `step` timed for the animated preview."""
         step = 0.001 * float(step)
-        print(f"    - Find scenes @ {step:.3f}", end=' ... ', flush=True)
-        _, took = ffmpeg(
-            f'-ss 00:00:04 -i "{asset.filename}" -filter_complex  \
-             "yadif=1,select=\'gt(scene,{step:.3f})\',setpts=N/(25*TB),scale={self.preview_width}:-1"  \
-             -vsync vfr "{tmp}{os.path.sep}%03d.png"'                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                      )
-        files = os.listdir(tmp)
-        count = len(files)
-        print(f"Found {count} in {took:.2f}s")
-        return files, count
-
-    def _uniform_image_check(self, output_filename: str) -> int:
-        """
-        Detect image features, determining if flat.
-        True if flat (feature-less) otherwise False
-        """
-        l_array = np.array([0, 0, 0])
-        u_array = np.array([50, 50, 50])
-        # pylint: disable=no-member
-        image = cv2.imdecode(np.fromfile(output_filename, dtype=np.uint8),
-                             cv2.IMREAD_UNCHANGED)
-        shape_mask = cv2.inRange(image, l_array, u_array)
-        contour_map = cv2.findContours(shape_mask.copy(), cv2.RETR_EXTERNAL,
-                                       cv2.CHAIN_APPROX_SIMPLE)
-        # pylint: enable=no-member
-        contours = imutils.grab_contours(contour_map)
-        contours_count = len(contours)
-        log.debug("Found %s black shapes", contours_count)
-        return contours_count < 20
+        return (f"select='gt(scene,{step:.3f})',scale={self.preview_width}:-1,"
+                f"settb=1/1000,setpts=N*{PREVIEW_DELAY}")
+
+    def _get_scenes(self,
+                    asset: LibraryAsset,
+                    step: int,
+                    scores: [] = None) -> None:
+        """
+        Stream scenes from video file into the animated preview. With
+        proxy analysis only the frames the score timeline `scores`
+        selects at `step` are decoded at full quality.
+        """
+        print(f"    - Find scenes @ {0.001 * step:.3f}", end=' ... ', flush=True)
+        segments = self._segments(asset)
+        if self.options.proxy_analysis and scores is not None:
+            took = self._get_timeline_scenes(asset, step, scores)
+        elif len(segments) > 1:
+            took = self._get_segment_scenes(asset, step, segments)
+        else:
+            _, took = ffmpeg(
+                f'-ss 00:00:04 -i "{asset.filename}" -filter_complex  \
+                 "yadif=1,{self._scene_filter(step)}" {WEBP_ENCODER} "{asset.webp_filename}"'
+            )
+        print(f"Encoded in {took:.2f}s")
+
+    def _get_segment_scenes(self, asset: LibraryAsset, step: int,
+                            segments: []) -> float:
+        """
+        Select the scene frames of each segment in parallel, then encode
+        them in order into the animated preview.
+        """
+        start_time = time.time()
+        attributes = asset.attributes
+        width = self.preview_width
+        height = int((width / attributes.width) * attributes.height)
+        args = []
+        for start, length in segments:
+            inputs, trim, _ = self._segment_input(asset, start, length)
+            args.append(
+                f'{inputs} -filter_complex "yadif=1,select=\'gt(scene,{0.001 * step:.3f})\',{trim},scale={width}:{height},setsar=1,format=bgr24" \
+                -vsync passthrough -f rawvideo -pix_fmt bgr24 -')
+        frame_size = width * height * 3
+        with tempfile.TemporaryDirectory(prefix="preview") as tmp:
+            raw_filename = os.path.join(tmp, "scenes.raw")
+            with open(raw_filename, "wb") as raw_file:
+                for result in self._run_segments(args, binary=True):
+                    stdout = result.stdout
+                    raw_file.write(stdout[:len(stdout) // frame_size *
+                                          frame_size])
+            self._encode_webp_frames(asset, raw_filename, width, height)
+        return time.time() - start_time
+
+    def _get_timeline_scenes(self, asset: LibraryAsset, step: int,
+                             scores: []) -> float:
+        """
+        Decode just the frames scoring above `step` in the timeline
+        `scores` at full quality, then encode them in order into the
+        animated preview.
+
+        Nearby frames share a short decode window, started just before
+        the first so the deinterlacer sees its previous field. Frames
+        are picked by timeline time from the same doubled frame rate
+        deinterlace the scores came from, in batches of windows.
+        """
+        start_time = time.time()
+        attributes = asset.attributes
+        width = self.preview_width
+        height = int((width / attributes.width) * attributes.height)
+        times = [START_OFFSET + t for t, score in scores
+                 if score > 0.001 * step]
+        windows = []
+        for frame_time in times:
+            if windows and frame_time - windows[-1][-1] <= SCENE_WINDOW_GAP:
+                windows[-1].append(frame_time)
+            else:
+                windows.append([frame_time])
+        # Half the field interval either side of a frame time
+        tolerance = 0.25 / max(attributes.fps, 1)
+        args = []
+        for i in range(0, len(windows), SCENE_BATCH):
+            batch = windows[i:i + SCENE_BATCH]
+            inputs, graph = [], []
+            for j, window in enumerate(batch):
+                seek = max(0.0, window[0] - SCENE_WINDOW_LEAD)
+                duration = window[-1] - seek + SCENE_WINDOW_LEAD
+                inputs.append(
+                    f'-ss {seek:.3f} -t {duration:.3f} -i "{asset.filename}"')
+                picks = "+".join(f"lt(abs(t-{t - seek:.3f}),{tolerance:.4f})"
+                                 for t in window)
+                graph.append(
+                    f"[{j}:v]yadif=1,select='{picks}',scale={width}:{height},setsar=1,format=bgr24[v{j}];"
+                )
+            graph.append("".join(f"[v{j}]" for j in range(len(batch))) +
+                         f"concat=n={len(batch)}:v=1:a=0[out]")
+            args.append(f'{" ".join(inputs)} -filter_complex "{"".join(graph)}" \
+                -map "[out]" -vsync passthrough -f rawvideo -pix_fmt bgr24 -')
+        frame_size = width * height * 3
+        with tempfile.TemporaryDirectory(prefix="preview") as tmp:
+            raw_filename = os.path.join(tmp, "scenes.raw")
+            with open(raw_filename, "wb") as raw_file:
+                for result in self._run_segments(args, binary=True):
+                    stdout = result.stdout
+                    raw_file.write(stdout[:len(stdout) // frame_size *
+                                          frame_size])
+            self._encode_webp_frames(asset, raw_filename, width, height)
+        return time.time() - start_time
+
+    def _encode_webp_frames(self, asset: LibraryAsset, raw_filename: str,
+                            width: int, height: int) -> None:
+        """Encode raw bgr24 frames into the animated preview."""
+        if os.path.getsize(raw_filename):
+            ffmpeg(f'-f rawvideo -pix_fmt bgr24 -s {width}x{height} \
+                -i "{raw_filename}" -vf "settb=1/1000,setpts=N*{PREVIEW_DELAY}" \
+                {WEBP_ENCODER} "{asset.webp_filename}"',
+                   profile="encode")
+
+    def _first_detailed_frame(self, frames) -> int:
+        """Index of the first of the stacked `frames` not flat, else None."""
+        scores = score_frames(frames)
+        log.debug("Frame flatness %s", np.round(scores.flatness, 2))
+        detailed = np.flatnonzero(~scores.flat)
+        return int(detailed[0]) if len(detailed) else None
 
     def generate_tile_thumbnail_file(self, files: [], output_filename):
         """Creates a mosaic of input files."""
-        count = len(files)
-        dim = 5
-        while count < dim * dim:
-            dim -= 1
-        log.debug("tile - %s %dx%s - %d", output_filename, dim, dim, count)
-        gw = int(350 / dim)
-        gh = int(200 / dim)
-        files = ' '.join('"{0}"'.format(f) for f in files[:dim*dim])
-        call(
-            f'montage {files} -geometry {gw}x{gh}+0+0 -tile {dim}x{dim} -gravity center -background black "{output_filename}"'
-        )
+        log.debug("tile - %s - %d", output_filename, len(files))
+        if not write_mosaic(files, output_filename, self._thumbnails,
+                            self.preview_width * 2):
+            log.warning("No thumbnails for %s", output_filename)
 
-    def generate_thumbnail_file(self, asset: LibraryAsset) -> None:
-        """Create a poster image from the first 2sec video mark."""
-        output_filename = asset.tile_image_filename
-        offset = 1
+    def _seek_frames(self,
+                     asset: LibraryAsset,
+                     offsets: [],
+                     width: int,
+                     height: int,
+                     keyframes: bool = False,
+                     proxy: bool = False) -> (np.ndarray, []):
+        """
+        Decode one frame at each second of `offsets` with fast input
+        seeking, returning them stacked as a (n, height, width, 3) array
+        along with the time of each frame.
+
+        With `keyframes` the keyframe at or before each offset is taken
+        instead of decoding on to the exact time. With `proxy` frames are
+        decoded with the cheaper (lower quality) proxy decoder options.
+        """
+        seek = "-noaccurate_seek " if keyframes else ""
+        if proxy:
+            seek += f"{PROXY_DECODE} "
+        inputs = " ".join(f'{seek}-ss {offset} -t 1 -i "{asset.filename}"'
+                          for offset in offsets)
+        graph = "".join(
+            f"[{i}:v]trim=end_frame=1,showinfo@f{i},scale={width}:{height},setsar=1,format=bgr24[v{i}];"
+            for i in range(len(offsets)))
+        graph += "".join(f"[v{i}]" for i in range(len(offsets)))
+        graph += f"concat=n={len(offsets)}:v=1:a=0[out]"
+        args, threads = threaded_args(
+            f'{inputs} -filter_complex "{graph}" -map "[out]" \
+            -vsync passthrough -f rawvideo -pix_fmt bgr24 -', "decode")
+        stdout, stderr, _ = call(
+            f'ffmpeg -hwaccel auto -hide_banner -loglevel info -y {args}',
+            binary=True,
+            threads=threads)
+        # Frame times are relative to the seek of their input
+        found = {
+            int(i): offsets[int(i)] + float(t)
+            for i, t in re.findall(r"\[showinfo@f(\d+) .* pts_time:(\S+)",
+                                   stderr)
+        }
+        frame_size = width * height * 3
+        count = min(len(stdout) // frame_size, len(found))
+        frames = np.frombuffer(stdout[:count * frame_size],
+                               dtype=np.uint8).reshape(count, height, width, 3)
+        return frames, [round(found[i], 3) for i in sorted(found)][:count]
+
+    def _write_jpeg_file(self,
+                         image,
+                         output_filename: str,
+                         max_bytes: int = 0) -> None:
+        """
+        Encode a BGR `image` to jpeg file `output_filename`, lowering
+        the quality until it is no more than `max_bytes` when set.
+        """
+        quality = 85
         while True:
-            ffmpeg(
-                f'-i "{asset.filename}" -ss 00:{int(offset / 60):02d}:{offset % 60:02d} -vframes 1 -q:v 5 \
-                    -vf "scale={self.preview_width*2}:-1" "{output_filename}"'                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                    )
-            if offset > 500 and not os.path.exists(output_filename):
-                print("Unable to find thumbnail!")
+            # pylint: disable=no-member
+            _, data = cv2.imencode(".jpg", image,
+                                   [cv2.IMWRITE_JPEG_QUALITY, quality])
+            # pylint: enable=no-member
+            if not max_bytes or data.size <= max_bytes or quality <= 25:
                 break
-            elif self._uniform_image_check(output_filename):
-                offset += 4
-            else:
-                size = sizeof_fmt(os.path.getsize(output_filename))
-                print(f"    Thumbnail size {size}")
+            quality -= 10
+        write_atomic(output_filename, data.tobytes())
+
+    def generate_thumbnail_file(self, asset: LibraryAsset) -> None:
+        """
+        Create a poster image from the first non flat frame sampled
+        every 4sec from the 1sec mark. Candidates are decoded in batches
+        starting with one and doubling while every candidate is flat, as
+        the first is usually used.
+        """
+        output_filename = asset.tile_image_filename
+        attributes = asset.attributes
+        width = self.preview_width * 2
+        height = int(width * attributes.height / attributes.width) // 2 * 2
+        # Proxy analysis scores tiny candidates, decoding the chosen one
+        # again at full quality
+        proxy = self.options.proxy_analysis
+        score_width = min(width, SCORE_WIDTH) if proxy else width
+        score_height = int(score_width * height / width) // 2 * 2
+        offsets = list(range(1, min(501, max(attributes.duration, 2)), 4))
+        chosen, fallback = None, None
+        i, size = 0, 1
+        while i < len(offsets):
+            batch = offsets[i:i + size]
+            i, size = i + size, min(size * 2, THUMBNAIL_BATCH)
+            frames, times = self._seek_frames(asset, batch, score_width,
+                                              score_height, proxy=proxy)
+            log.debug("Thumbnail candidates %s - %d", batch, len(frames))
+            if not len(frames):
+                continue
+            if fallback is None:
+                fallback = (frames[0], times[0])
+            index = self._first_detailed_frame(frames)
+            if index is not None:
+                chosen = (frames[index], times[index])
                 break
+        if chosen is None:
+            if fallback is None:
+                print("Unable to find thumbnail!")
+                return
+            print("Only flat thumbnails found!")
+            chosen = fallback
+        image, offset = chosen
+        if proxy:
+            frames, _ = self._seek_frames(asset, [offset], width, height)
+            if not len(frames):
+                print("Unable to find thumbnail!")
+                return
+            image = frames[0]
+        self._write_jpeg_file(image, output_filename)
+        size = sizeof_fmt(os.path.getsize(output_filename))
+        print(f"    Thumbnail size {size}")
+
+    def _scrub_times(self, asset: LibraryAsset) -> []:
+        """Get the seconds of the scrub tiles sampled every interval from
+        the 4sec mark."""
+        attributes = asset.attributes
+        interval, cols, rows = attributes.calc_scrub_image_properties(
+            self.preview_width)
+        times = [START_OFFSET + i * interval for i in range(cols * rows)]
+        return [t for t in times if t < attributes.duration] or [0]
 
-    def generate_vtt_file(self, asset: LibraryAsset) -> None:
-        """ Create a VTT description for the scrub image sprite."""
-        name = asset.scrub_image_uri
+    def generate_vtt_file(self,
+                          asset: LibraryAsset,
+                          times: [] = None) -> None:
+        """
+        Create a VTT description for the scrub image sheets, with a cue
+        from each tile's sampled time (in seconds) until the next.
+        """
         attributes = asset.attributes
         width = self.preview_width
         height = int((width / attributes.width) * attributes.height)
-        interval, snaps, rows = attributes.calc_scrub_image_properties(width)
-        total_time, x_off, y_off, i = 0, 0, 0, 1
+        times = times or self._scrub_times(asset)
+        cols, rows, _ = self._scrub_grid(asset, len(times))
+        starts = [0] + times[1:]
+        # The last tile is shown for the sampling interval of a second
+        ends = times[1:] + [times[-1] + 1]
         with open(asset.vtt_filename, "w") as vtt_file:
             vtt_file.write("WEBVTT\n\n")
-            while i < snaps * rows:
-                vtt_file.write(f"{i}\n")
-                vtt_file.write(f"{self._time_code(total_time)} ")
-                vtt_file.write(
-                    f"--> {self._time_code(total_time + interval * 1000)}\n")
+            for i, (start, end) in enumerate(zip(starts, ends)):
+                if end <= start:
+                    continue
+                page, cell = divmod(i, cols * rows)
+                x_off, y_off = (cell % cols) * width, (cell // cols) * height
+                name = asset.scrub_page_uri(page)
+                # Cue identifiers are optional
+                if not self.options.minify:
+                    vtt_file.write(f"{i + 1}\n")
+                vtt_file.write(f"{self._time_code(start * 1000)} ")
+                vtt_file.write(f"--> {self._time_code(end * 1000)}\n")
                 vtt_file.write(
                     f"{name}#xywh={x_off},{y_off},{width},{height}\n")
                 vtt_file.write(f"\n")
-                total_time += (interval * 1000)
-                x_off += width
-                i += 1
-                if i % snaps == 0:
-                    x_off = 0
-                    y_off += height
-
-    def generate_video_scrub_file(self, asset: LibraryAsset):
-        """Generate a XxY jpeg tile for scrubbing video timeline."""
+
+    def _scrub_grid(self, asset: LibraryAsset, count: int) -> (int, int, int):
+        """
+        Get the columns and rows of each scrub sheet and the number of
+        sheets for `count` tiles. Sheets are paged when a maximum sheet
+        size is set, otherwise a single sprite holds every tile.
+        """
         width = self.preview_width
         attributes = asset.attributes
-        _, cols, rows = attributes.calc_scrub_image_properties(width)
-        ffmpeg(f'-ss 00:00:04 -i "{asset.filename}" -frames 1 -q:v 2 -vf \
-             "yadif=1,select=\'not(mod(n\\,{attributes.fps * 2}))\',scale={width}:-1,tile={cols}x{rows}" \
-             "{asset.scrub_image_filename}"'                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                        )
-        size = sizeof_fmt(os.path.getsize(asset.scrub_image_filename))
-        print(f"    Timeline size {size} for {cols}x{rows}")
+        size = self.options.scrub_page_size
+        if not size:
+            _, cols, rows = attributes.calc_scrub_image_properties(width)
+            return cols, rows, 1
+        height = int((width / attributes.width) * attributes.height)
+        cols, rows = max(1, size // width), max(1, size // height)
+        return cols, rows, max(1, math.ceil(count / (cols * rows)))
+
+    def _scrub_tile_output(self, asset: LibraryAsset, count: int,
+                           tmp: str) -> (str, str):
+        """
+        Get the ffmpeg tile filter and output for `count` scrub tiles,
+        paged sheets being written to `tmp` for `_store_scrub_pages`.
+        """
+        cols, rows, pages = self._scrub_grid(asset, count)
+        if pages > 1:
+            output = (f'-vsync passthrough -start_number 0 -q:v 2 '
+                      f'"{tmp}{os.path.sep}scrub%d.jpg"')
+        else:
+            output = f'-frames:v 1 -q:v 2 "{asset.scrub_image_filename}"'
+        return f"tile={cols}x{rows}", output
+
+    def _store_scrub_pages(self, asset: LibraryAsset, times: [],
+                           tmp: str) -> []:
+        """
+        Move the sheets written by ffmpeg into place, keeping them within
+        the byte limit. Returns the `times` of the tiles on the sheets
+        written, fewer when ffmpeg decoded fewer frames than sampled.
+        """
+        cols, rows, pages = self._scrub_grid(asset, len(times))
+        if pages > 1:
+            pages = 0
+            while os.path.exists(os.path.join(tmp, f"scrub{pages}.jpg")):
+                os.replace(os.path.join(tmp, f"scrub{pages}.jpg"),
+                           asset.scrub_page_filename(pages))
+                pages += 1
+        for page in range(pages):
+            filename = asset.scrub_page_filename(page)
+            max_bytes = self.options.scrub_page_bytes
+            if max_bytes and os.path.getsize(filename) > max_bytes:
+                # pylint: disable=no-member
+                image = cv2.imdecode(np.fromfile(filename, dtype=np.uint8),
+                                     cv2.IMREAD_COLOR)
+                # pylint: enable=no-member
+                self._write_jpeg_file(image, filename, max_bytes)
+        self._remove_scrub_pages(asset, pages)
+        return times[:max(pages, 1) * cols * rows]
+
+    def _write_scrub_sheets(self, asset: LibraryAsset, tiles: []) -> None:
+        """Tile frames onto the scrub sheets, a None tile left black."""
+        width = self.preview_width
+        attributes = asset.attributes
+        height = int((width / attributes.width) * attributes.height)
+        cols, rows, pages = self._scrub_grid(asset, len(tiles))
+        per_page = cols * rows
+        for page in range(pages):
+            sheet = np.zeros((rows * height, cols * width, 3), dtype=np.uint8)
+            for i, tile in enumerate(tiles[page * per_page:(page + 1) *
+                                           per_page]):
+                if tile is not None:
+                    row, col = divmod(i, cols)
+                    sheet[row * height:(row + 1) * height,
+                          col * width:(col + 1) * width] = tile
+            self._write_jpeg_file(sheet, asset.scrub_page_filename(page),
+                                  self.options.scrub_page_bytes)
+        self._remove_scrub_pages(asset, pages)
+
+    @staticmethod
+    def _detach(filenames: []) -> None:
+        """
+        Remove artifacts about to be rebuilt, as ffmpeg writes into an
+        existing file and would change previews it is hard linked with.
+        """
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def _remove_scrub_pages(self, asset: LibraryAsset, pages: int) -> None:
+        """Remove sheets left from an earlier, longer, paging."""
+        while os.path.exists(asset.scrub_page_filename(pages)):
+            os.remove(asset.scrub_page_filename(pages))
+            pages += 1
+
+    def generate_video_scrub_file(self, asset: LibraryAsset) -> []:
+        """
+        Generate jpeg tiles for scrubbing video timeline, returning the
+        sampled times. Every tile is in one XxY sprite unless a sheet
+        size is set, when the tiles are paged over fixed size sheets.
+
+        By default every frame is decoded and deinterlaced. The `exact`
+        and `keyframe` scrub seek modes instead seek to each sample,
+        decoding on to the exact time or only the nearest keyframe.
+        """
+        width = self.preview_width
+        segments = self._segments(asset)
+        if self.options.scrub_seek == "decode" and len(segments) > 1:
+            times = self._segment_scrub_file(asset, segments)
+        elif self.options.scrub_seek == "decode":
+            times = self._scrub_times(asset)
+            with tempfile.TemporaryDirectory(prefix="scrub") as tmp:
+                tile, output = self._scrub_tile_output(asset, len(times), tmp)
+                _, stderr, _ = self._ffmpeg_info(
+                    f'-ss 00:00:04 -i "{asset.filename}" -vf \
+                     "yadif=1,{SCRUB_SELECT},showinfo@scrub,scale={width}:-1,{tile}" \
+                     {output}')
+                times = self._store_scrub_pages(
+                    asset, self._shown_times(stderr, START_OFFSET, times),
+                    tmp)
+        else:
+            times = self._seek_scrub_file(asset)
+        cols, rows, pages = self._scrub_grid(asset, len(times))
+        size = sum(
+            os.path.getsize(asset.scrub_page_filename(p))
+            for p in range(pages))
+        sheets = f" on {pages} sheets" if pages > 1 else ""
+        print(f"    Timeline size {sizeof_fmt(size)} for {cols}x{rows}{sheets}")
+        return times
+
+    def _segment_scrub_file(self, asset: LibraryAsset, segments: []) -> []:
+        """Tile the frames sampled from each segment in parallel."""
+        width = self.preview_width
+        attributes = asset.attributes
+        height = int((width / attributes.width) * attributes.height)
+        nominal = self._scrub_times(asset)
+        args = []
+        for start, length in segments:
+            inputs, trim, _ = self._segment_input(asset, start, length)
+            args.append(
+                f'-loglevel info {inputs} -filter_complex "yadif=1,{trim},setpts=PTS-STARTPTS,{SCRUB_SELECT},showinfo@scrub,scale={width}:{height},setsar=1,format=bgr24" \
+                -vsync passthrough -f rawvideo -pix_fmt bgr24 -')
+        tiles, times = [], []
+        frame_size = width * height * 3
+        for (start, _), result in zip(segments,
+                                      self._run_segments(args, True)):
+            # Frame times start from the segment
+            found = self._shown_times(result.stderr, START_OFFSET + start)
+            count = min(len(found), len(result.stdout) // frame_size)
+            frames = np.frombuffer(result.stdout[:count * frame_size],
+                                   dtype=np.uint8).reshape(
+                                       count, height, width, 3)
+            tiles.extend(frames)
+            times.extend(found[:count])
+        if not times:
+            log.warning("No scrub frames decoded for %s", asset.filename)
+            return nominal[:1]
+        self._write_scrub_sheets(asset, tiles[:len(nominal)])
+        return times[:len(nominal)]
+
+    def _ffmpeg_info(self, args: str) -> (str, str, int):
+        """Run a decode logging at info level, so the times of the frames
+        passed through showinfo can be read from stderr."""
+        args, threads = threaded_args(args, "decode")
+        return call(f"{FFMPEG} -loglevel info {args}", threads=threads)
+
+    @staticmethod
+    def _shown_times(stderr: str, offset: float, nominal: [] = None) -> []:
+        """
+        Get the times of the frames logged by the `showinfo@scrub` filter
+        in seconds from `offset`, else the `nominal` sample times.
+        """
+        times = [
+            round(offset + float(t), 3)
+            for t in re.findall(r"\[showinfo@scrub .*? pts_time:(\S+)",
+                                stderr)
+        ]
+        if not times and nominal:
+            log.warning("No scrub frame times found, using sample times")
+            return nominal
+        return times
+
+    def _seek_scrub_file(self, asset: LibraryAsset) -> []:
+        """Tile frames decoded by seeking to each scrub sample."""
+        width = self.preview_width
+        attributes = asset.attributes
+        height = int((width / attributes.width) * attributes.height)
+        keyframes = self.options.scrub_seek == "keyframe"
+        offsets = self._scrub_times(asset)
+        tiles, times = [], []
+        for i in range(0, len(offsets), SCRUB_BATCH):
+            frames, found = self._seek_frames(asset,
+                                              offsets[i:i + SCRUB_BATCH],
+                                              width, height, keyframes)
+            for frame, time_ in zip(frames, found):
+                # Samples between keyframes share the same frame
+                if times and time_ <= times[-1]:
+                    continue
+                tiles.append(frame)
+                times.append(time_)
+        self._write_scrub_sheets(asset, tiles)
+        return times
+
+    def _analyse_scenes(self, asset: LibraryAsset) -> []:
+        """
+        Score the scene change of every frame, decoding the segments of
+        long videos in parallel.
+
+        Returns [pts_time, score] pairs for the frames a scene detection
+        step (an integer per mille threshold) is able to select.
+        """
+        print("    - Analyse scenes", end=' ... ', flush=True)
+        start_time = time.time()
+        args, offsets = [], []
+        for start, length in self._segments(asset):
+            inputs, trim, offset = self._segment_input(asset,
+                                                       start,
+                                                       length,
+                                                       analysis=True)
+            args.append(f'{inputs} -filter_complex  \
+                "{self._analysis_filter()},select=\'gte(scene,0)\',{trim},metadata=print:file=-" -f null -'
+                        )
+            offsets.append(offset)
+        scores = []
+        for result, offset in zip(self._run_segments(args), offsets):
+            scores += self._parse_scene_scores(result.stdout, offset)
+        took = time.time() - start_time
+        print(f"Scored {len(scores)} in {took:.2f}s")
+        return scores
+
+    def _parse_scene_scores(self, text: str, offset: float = 0) -> []:
+        """Parse scene scores written by the ffmpeg metadata filter,
+        offsetting the frame times by `offset` seconds."""
+        scores = []
+        pts_time = 0.0
+        for line in text.splitlines():
+            if line.startswith("frame:"):
+                pts_time = float(line.rsplit("pts_time:", 1)[1]) + offset
+            elif line.startswith("lavfi.scene_score="):
+                score = float(line.split("=", 1)[1])
+                if score > 0.001:
+                    scores.append([round(pts_time, 3), score])
+        return scores
+
+    def _load_scene_scores(self, asset: LibraryAsset) -> []:
+        """Load the scene score timeline, None if missing or stale."""
+        if os.path.exists(asset.scenes_filename):
+            with open(asset.scenes_filename, "r") as scenes_file:
+                timeline = json.load(scenes_file)
+            # Scores of full frames are as good for proxy analysis
+            if (timeline.get("source") == file_signature(asset.filename)
+                    and timeline.get("analysis", "full") in
+                    ("full", self._analysis_mode())):
+                return timeline["scores"]
+            log.debug("Stale scene timeline %s", asset.scenes_filename)
+        return None
+
+    def _analysis_mode(self) -> str:
+        """Name how frames are decoded for scoring."""
+        return "proxy" if self.options.proxy_analysis else "full"
+
+    def _save_scene_scores(self,
+                           asset: LibraryAsset,
+                           scores: [],
+                           analysis: str = None) -> None:
+        """Save the scene score timeline next to the meta file, scored
+        in `analysis` mode (the current mode by default)."""
+        timeline = {
+            "source": file_signature(asset.filename),
+            "offset": START_OFFSET,
+            "analysis": analysis or self._analysis_mode(),
+            "scores": scores
+        }
+        with open(asset.scenes_filename, "w") as scenes_file:
+            json.dump(timeline, scenes_file, separators=(',', ':'))
+
+    def _get_scene_scores(self, asset: LibraryAsset) -> []:
+        """Load the scene score timeline, analysing the video if stale."""
+        scores = self._load_scene_scores(asset)
+        if scores is None:
+            scores = self._analyse_scenes(asset)
+            self._save_scene_scores(asset, scores)
+        return scores
+
+    def _choose_scene_step(self, scores: []):
+        """
+        Walk the scene detection steps against a score timeline.
+
+        Mirrors the ffmpeg retry loop in memory, the last evaluated
+        step and count being the final entries of `steps` and `values`.
+        """
+        values = np.array([score for _, score in scores])
+        state = collections.namedtuple('State', ['values', 'steps', 'step'])
+        state.values = []
+        state.steps = []
+        state.step = self.options.default_scene_detection
+        while True:
+            count = int(np.count_nonzero(values > 0.001 * state.step))
+            if not self._step(state, count):
+                break
+            if state.step in state.steps:
+                log.debug("Scene step %d already tried", state.step)
+                break
+        return state
+
+    def _finish_webp_file(self, asset, state) -> bool:
+        """Record the encoded animated preview, else mark it ignored."""
+        if not os.path.exists(asset.webp_filename) or not os.path.getsize(
+                asset.webp_filename):
+            self._ignore_webp_file(asset)
+            return False
+        attributes = asset.attributes
+        attributes.preview_delay = PREVIEW_DELAY
+        attributes.step_v_values = list(
+            map(list, zip(state.steps, state.values)))
+        size = os.path.getsize(asset.webp_filename)
+        print(f"    Webp size: {sizeof_fmt(size)} from {state.values[-1]}")
+        return True
+
+    def _ignore_webp_file(self, asset) -> None:
+        """Mark the video as having no usable animated preview."""
+        print(f"    Webp creation failed!")
+        with open(asset.webp_filename + ".ignore", "w") as ignore:
+            ignore.write("Ignore")
 
     def generate_animated_webp_file(self, asset):
         """Generate an animated preview for input video."""
         output_filename = asset.webp_filename
         if os.path.exists(output_filename + ".ignore"):
             return False, 0
-        state = collections.namedtuple('State', ['values', 'steps', 'step'])
-        state.values = []
-        state.steps = []
-        state.step = self.options.default_scene_detection
         start_time = time.time()
-        count = 0
-        attributes = asset.attributes
-        while not os.path.exists(output_filename + ".ignore"):
-            with tempfile.TemporaryDirectory(prefix="preview") as tmp_basename:
-                files, count = self._get_scenes(asset, state.step,
-                                                tmp_basename)
-                if self._step(state, count):
-                    continue
-                elif count > 0:
-                    attributes.preview_delay = 210
-                    attributes.step_v_values = list(
-                        map(list, zip(state.steps, state.values)))
-                    files = " ".join(files)
-                    call(
-                        f'img2webp -min_size -lossy -d {attributes.preview_delay} {files} -o "{os.path.abspath(output_filename)}"',
-                        cwd=tmp_basename)
-                    size = os.path.getsize(output_filename)
-                    print(f"    Webp size: {sizeof_fmt(size)} from {count}")
-                    break
-                else:
-                    print(f"    Webp creation failed!")
-                    with open(output_filename + ".ignore", "w") as ignore:
-                        ignore.write("Ignore")
-                    break
+        scores = self._get_scene_scores(asset)
+        state = self._choose_scene_step(scores)
+        step, count = state.steps[-1], state.values[-1]
+        if os.path.exists(output_filename):
+            os.remove(output_filename)
+        if count > 0:
+            self._get_scenes(asset, step, scores)
+        created = self._finish_webp_file(asset, state)
         end_time = time.time()
         log.debug("Time to find %2fs", end_time - start_time)
-        return count > 0, state.step
+        return created, step
+
+    def generate_shared_artifacts(self, asset: LibraryAsset, thumb: bool,
+                                  preview: bool, scrub: bool) -> []:
+        """
+        Create the thumbnail, animated preview and scrub tile from one
+        decode, splitting the filter graph into a branch per artifact.
+        Returns the sampled times of the scrub tiles.
+
+        Scene frames need a detection step, so without a saved scene
+        timeline the preview branch only scores scenes and the frames
+        are extracted afterwards by `generate_animated_webp_file`.
+        """
+        width = self.preview_width
+        attributes = asset.attributes
+        state = None
+        if preview and os.path.exists(asset.webp_filename + ".ignore"):
+            preview = False
+        elif preview:
+            scores = self._load_scene_scores(asset)
+            if scores is not None:
+                state = self._choose_scene_step(scores)
+                if state.values[-1] == 0:
+                    self._ignore_webp_file(asset)
+                    preview = False
+        times = None
+        if not (thumb or preview or scrub):
+            return times
+        with tempfile.TemporaryDirectory(prefix="preview") as tmp:
+            tmp_basename = f"{tmp}{os.path.sep}"
+            branches, outputs = [], []
+            if thumb:
+                branches.append(
+                    f"select='gte(t,1)*lte(t,501)*(isnan(prev_selected_t)+gte(t-prev_selected_t,4))',scale={width*2}:-1[thumbs]"
+                )
+                outputs.append(
+                    f'-map "[thumbs]" -vsync vfr -q:v 5 "{tmp_basename}thumb%03d.jpg"'
+                )
+            deinterlaced = []
+            if scrub:
+                times = self._scrub_times(asset)
+                tile, output = self._scrub_tile_output(asset, len(times), tmp)
+                deinterlaced.append(
+                    f"{SCRUB_SELECT},showinfo@scrub,scale={width}:-1,{tile}[scrub]"
+                )
+                outputs.append(f'-map "[scrub]" {output}')
+            if preview and state:
+                if os.path.exists(asset.webp_filename):
+                    os.remove(asset.webp_filename)
+                deinterlaced.append(
+                    f"{self._scene_filter(state.steps[-1])}[scenes]")
+                outputs.append(
+                    f'-map "[scenes]" {WEBP_ENCODER} "{asset.webp_filename}"')
+            elif preview:
+                deinterlaced.append(
+                    "select='gte(scene,0)',metadata=print:file=-[scores]")
+                outputs.append('-map "[scores]" -f null -')
+            if deinterlaced:
+                labels = "".join(f"[d{i}]" for i in range(len(deinterlaced)))
+                branches.append(
+                    f"trim=start=4,setpts=PTS-STARTPTS,yadif=1,split={len(deinterlaced)}{labels};"
+                    + ";".join(f"[d{i}]{branch}"
+                               for i, branch in enumerate(deinterlaced)))
+            labels = "".join(f"[b{i}]" for i in range(len(branches)))
+            graph = f"[0:v]split={len(branches)}{labels};" + ";".join(
+                f"[b{i}]{branch}" for i, branch in enumerate(branches))
+            print("    - Shared decode", end=' ... ', flush=True)
+            stdout, stderr, took = self._ffmpeg_info(
+                f'-i "{asset.filename}" -filter_complex "{graph}" {" ".join(outputs)}'
+            )
+            print(f"Done in {took:.2f}s")
+            if thumb:
+                self._pick_thumbnail_file(asset, tmp)
+            if scrub:
+                # The scrub branch is trimmed from the 4sec mark
+                times = self._store_scrub_pages(
+                    asset, self._shown_times(stderr, START_OFFSET, times),
+                    tmp)
+                size = sizeof_fmt(os.path.getsize(asset.scrub_image_filename))
+                print(f"    Timeline size {size}")
+            if preview and state:
+                self._finish_webp_file(asset, state)
+        if preview and not state:
+            # Scored on the full frames of the shared decode
+            self._save_scene_scores(asset, self._parse_scene_scores(stdout),
+                                    "full")
+            self.generate_animated_webp_file(asset)
+        return times
+
+    def _pick_thumbnail_file(self, asset: LibraryAsset, tmp) -> None:
+        """Keep the first candidate thumbnail in `tmp` that is not flat."""
+        candidates = sorted(f for f in os.listdir(tmp)
+                            if f.startswith("thumb"))
+        if not candidates:
+            print("Unable to find thumbnail!")
+            return
+        # pylint: disable=no-member
+        frames = np.stack([
+            cv2.imdecode(np.fromfile(os.path.join(tmp, f), dtype=np.uint8),
+                         cv2.IMREAD_COLOR) for f in candidates
+        ])
+        # pylint: enable=no-member
+        index = self._first_detailed_frame(frames)
+        if index is None:
+            print("Only flat thumbnails found!")
+            index = 0
+        chosen = candidates[index]
+        os.replace(os.path.join(tmp, chosen), asset.tile_image_filename)
+        size = sizeof_fmt(os.path.getsize(asset.tile_image_filename))
+        print(f"    Thumbnail size {size}")
 
     def generate_meta_file(self, asset: LibraryAsset) -> None:
         """Create the preview meta file."""
         log.debug("Write meta file %s", asset.meta_filename)
         with open(asset.meta_filename, "w") as meta_file:
-            meta_file.write(asset.attributes.to_json())
+            meta_file.write(asset.attributes.to_json(self.options.minify))
 
     @classmethod
     def is_hidden_folder(cls, file_path):
@@ -212,29 +929,236 @@ class LibraryMaker:
                 return True
         return False
 
+    def _fingerprint_index(self) -> FingerprintIndex:
+        """Get the fingerprint index of the library path, building it on
+        first use for libraries previewed before it existed."""
+        if self._fingerprints is None:
+            root = self.options.entry_path
+            if not os.path.isdir(root):
+                root = os.path.dirname(os.path.dirname(root))
+            self._fingerprints = FingerprintIndex(root)
+            self._fingerprints.build()
+        return self._fingerprints
+
+    def _find_reusable(self, asset: LibraryAsset):
+        """
+        Find the asset and meta of a video with the same content as
+        `asset` previewed at another path with the same parameters.
+        """
+        fingerprint = asset.attributes.fingerprint
+        params = self._artifact_params(asset)
+        for meta_filename in self._fingerprint_index().find(fingerprint):
+            source = LibraryAsset.from_meta_filename(meta_filename)
+            if source.filename == asset.filename:
+                continue
+            try:
+                with open(meta_filename, "r") as meta_file:
+                    meta = json.load(meta_file)
+            except (ValueError, OSError):
+                continue
+            # Renamed away or replaced since it was indexed
+            if (not isinstance(meta, dict)
+                    or meta.get("fingerprint") != fingerprint or
+                    not all(os.path.exists(f)
+                            for f in source.artifact_filenames)):
+                continue
+            built = self._read_manifest(source.manifest_filename)
+            if any(built.get(key, value) != value
+                   for key, value in params.items()):
+                log.debug("Previews of %s built differently", source.filename)
+                continue
+            return source, meta
+        return None
+
+    def reuse_artifacts(self, asset: LibraryAsset) -> bool:
+        """
+        Link (or copy) the previews of a video with the same content
+        previewed at another path, e.g. after a rename or for a duplicate.
+        """
+        found = self._find_reusable(asset)
+        if not found:
+            return False
+        source, meta = found
+        print(f"    Reusing previews of {source.filename}")
+        for src, dst in zip(source.artifact_filenames,
+                            asset.artifact_filenames):
+            if dst != asset.vtt_filename:
+                link_or_copy(src, dst)
+        pages = source.scrub_pages
+        for page in range(1, pages):
+            link_or_copy(source.scrub_page_filename(page),
+                         asset.scrub_page_filename(page))
+        self._remove_scrub_pages(asset, max(pages, 1))
+        # The VTT cues address the scrub sheets by name
+        with open(source.vtt_filename, "r") as vtt_file:
+            vtt = vtt_file.read()
+        for page in range(max(pages, 1)):
+            vtt = vtt.replace(f"{source.scrub_page_uri(page)}#",
+                              f"{asset.scrub_page_uri(page)}#")
+        write_atomic(asset.vtt_filename, vtt)
+        asset.attributes.reuse(meta)
+        return True
+
+    def _stage(self, name: str, asset: LibraryAsset, outputs: []):
+        """Time a stage creating `outputs` for `asset`."""
+        return metrics.span(name, outputs=outputs, video=asset.filename)
+
     def add_video(self, filename: str) -> LibraryAsset:
         """Create the preview artifacts for the input video."""
         asset = LibraryAsset(filename)
+        print(f"- {asset.filename}")
+        with metrics.span("video", video=asset.filename):
+            self._add_artifacts(asset)
+        return asset
+
+    def _artifact_params(self, asset: LibraryAsset) -> {}:
+        """
+        Get the inputs and parameters each kind of preview artifact is
+        built from, as recorded in the asset build manifest.
+        """
+        options = self.options
+        source = asset.attributes.fingerprint
+        width = self.preview_width
+        params = {
+            "thumbnail": {
+                "source": source,
+                "width": width
+            },
+            "preview": {
+                "source": source,
+                "width": width,
+                "scene": options.default_scene_detection
+            },
+            "scrub": {
+                "source": source,
+                "width": width,
+                "seek": options.scrub_seek,
+                "page_size": options.scrub_page_size,
+                "page_bytes": options.scrub_page_bytes
+            }
+        }
+        if options.proxy_analysis:
+            # Candidate and scene scores differ slightly on proxy frames
+            params["thumbnail"]["analysis"] = self._analysis_mode()
+            params["preview"]["analysis"] = self._analysis_mode()
+        return params
+
+    def _read_manifest(self, filename: str) -> {}:
+        """Load a build manifest, empty when missing or unreadable."""
+        try:
+            with open(filename, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+        except (ValueError, OSError):
+            return {}
+        return manifest if isinstance(manifest, dict) else {}
+
+    def _add_artifacts(self, asset: LibraryAsset) -> None:
+        """
+        Create the preview artifacts that are missing, forced or stale.
+
+        An artifact is stale when the build manifest records it was built
+        from other content or parameters, e.g. another preview width.
+        Artifacts built before the manifest existed are assumed current.
+        """
         os.makedirs(asset.preview_basedir, exist_ok=True)
         options = self.options
-        if options.thumb:
-            if not os.path.exists(asset.tile_image_filename) or options.force:
+        cached = asset.attributes.load_cache()
+        params = self._artifact_params(asset)
+        built = self._read_manifest(asset.manifest_filename)
+        manifest = dict(built)
+        changed = [k for k, v in params.items() if built.get(k, v) != v]
+        if changed:
+            log.debug("Stale %s for %s", changed, asset.filename)
+
+        def stale(key: str, filenames: []) -> bool:
+            """Check artifact `key` needs building."""
+            return (options.force or key in changed
+                    or not all(os.path.exists(f) for f in filenames))
+
+        thumb = options.thumb and stale("thumbnail",
+                                        [asset.tile_image_filename])
+        preview = options.preview and stale("preview", [asset.webp_filename])
+        scrub = options.scrub and stale(
+            "scrub", [asset.scrub_image_filename, asset.vtt_filename])
+        if (preview and "preview" in changed
+                and os.path.exists(asset.webp_filename + ".ignore")):
+            # No usable preview was found with the previous parameters
+            os.remove(asset.webp_filename + ".ignore")
+        if thumb + preview + scrub and not options.force and not any(
+                os.path.exists(f) for f in asset.artifact_filenames):
+            with self._stage("reuse", asset, asset.artifact_filenames):
+                if self.reuse_artifacts(asset):
+                    thumb = preview = scrub = False
+                    asset.updated = True
+        # Seeking scrub frames is cheaper than sharing a full decode
+        shared_scrub = scrub and options.scrub_seek == "decode"
+        if options.shared_decode and thumb + preview + shared_scrub > 1:
+            outputs = [
+                asset.tile_image_filename, asset.webp_filename,
+                asset.scrub_image_filename
+            ]
+            self._detach([
+                f for f, built in [(asset.tile_image_filename, thumb),
+                                   (asset.webp_filename, preview)] if built
+            ])
+            if shared_scrub:
+                self._detach([asset.vtt_filename])
+                self._remove_scrub_pages(asset, 0)
+            with self._stage("shared", asset, outputs):
+                times = self.generate_shared_artifacts(
+                    asset, thumb, preview, shared_scrub)
+            if shared_scrub:
+                with self._stage("vtt", asset, [asset.vtt_filename]):
+                    self.generate_vtt_file(asset, times)
+            asset.updated = True
+            thumb = preview = False
+            scrub = scrub and not shared_scrub
+        if thumb:
+            self._detach([asset.tile_image_filename])
+            with self._stage("thumbnail", asset,
+                             [asset.tile_image_filename]):
                 self.generate_thumbnail_file(asset)
-                asset.updated = True
-        if options.preview:
-            if not os.path.exists(asset.webp_filename) or options.force:
+            asset.updated = True
+        if preview:
+            self._detach([asset.webp_filename])
+            with self._stage("preview", asset, [asset.webp_filename]):
                 self.generate_animated_webp_file(asset)
-                asset.updated = True
-        if options.scrub:
-            if not (os.path.exists(asset.scrub_image_filename)
-                    and os.path.exists(asset.vtt_filename)) or options.force:
-                self.generate_video_scrub_file(asset)
-                self.generate_vtt_file(asset)
-                asset.updated = True
-        if not os.path.exists(asset.meta_filename):
-            self.generate_meta_file(asset)
             asset.updated = True
-        return asset
+        if scrub:
+            self._detach([asset.vtt_filename])
+            self._remove_scrub_pages(asset, 0)
+            with self._stage("scrub", asset, [asset.scrub_image_filename]):
+                times = self.generate_video_scrub_file(asset)
+            with self._stage("vtt", asset, [asset.vtt_filename]):
+                self.generate_vtt_file(asset, times)
+            asset.updated = True
+        for key, enabled in [("thumbnail", options.thumb),
+                             ("preview", options.preview),
+                             ("scrub", options.scrub)]:
+            if enabled:
+                manifest[key] = params[key]
+        if manifest != built:
+            write_atomic(asset.manifest_filename, dump_json(manifest))
+        if not cached:
+            with self._stage("meta", asset, [asset.meta_filename]):
+                self.generate_meta_file(asset)
+            asset.updated = True
+            self._fingerprint_index().add(asset.attributes.fingerprint,
+                                          asset.meta_filename)
+        if options.precompress:
+            # Scene timelines are only read back by later builds
+            self.precompress_files([asset.meta_filename, asset.vtt_filename])
+            for ext in PRECOMPRESSED_EXTS:
+                if os.path.exists(asset.scenes_filename + ext):
+                    os.remove(asset.scenes_filename + ext)
+
+    def precompress_files(self, filenames: []) -> None:
+        """Write compressed variants of the existing text outputs that
+        changed since their variants were written."""
+        with metrics.span("precompress", outputs=filenames):
+            for filename in filenames:
+                if os.path.exists(filename) and precompress(filename):
+                    log.debug("Precompressed %s", filename)
 
     def add_directory(self, path: str) -> []:
         """
@@ -242,37 +1166,154 @@ class LibraryMaker:
         memory library catalog.
         """
         print("Finding videos in directory ... ")
-        matching_files = find_files(path, "mp4")
+        path = os.path.normpath(path)
+        print(f"Searching {path} for *.mp4 ...")
+        matching_files = metrics.timed("discover",
+                                       walk_files(path, "mp4"),
+                                       path=path)
+        if self.options.jobs > 1:
+            return self.add_videos_parallel(matching_files, self.options.jobs)
         meta_infos = []
         for filename in matching_files:
-            if not LibraryMaker.is_hidden_folder(filename):
-                m_info = self.add_video(filename)
-                meta_infos.append(m_info)
+            m_info = self.add_video(filename)
+            meta_infos.append(m_info)
         return meta_infos
 
-    def create_catalog(self, output_filename: str, assets: []):
+    def add_videos_parallel(self, filenames, jobs: int) -> []:
+        """
+        Process `filenames` in a pool of `jobs` worker processes.
+
+        Each worker gets an even share of the core budget, which its
+        concurrent segment and single ffmpeg commands are held to. Videos
+        are submitted as they are found while assets and their console
+        output are returned in input order, keeping the catalog
+        deterministic.
+        """
+        print(f"Processing videos with {jobs} jobs ...")
+        meta_infos = []
+        # Build the index once rather than in every worker
+        self._fingerprint_index()
+
+        def collect(future):
+            asset, output, spans = future.result()
+            print(output, end='', flush=True)
+            metrics.extend(spans)
+            meta_infos.append(asset)
+
+        pending = collections.deque()
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=jobs, initializer=_init_worker,
+                initargs=(self, )) as executor:
+            for filename in filenames:
+                pending.append(executor.submit(_add_video_job, filename))
+                while pending and (pending[0].done()
+                                   or len(pending) > 2 * jobs):
+                    collect(pending.popleft())
+            while pending:
+                collect(pending.popleft())
+        return meta_infos
+
+    def _group_inputs(self, files: []) -> str:
+        """Digest the thumbnail versions and layout a group tile is
+        composed from."""
+        inputs = [MOSAIC_WIDTH, MOSAIC_HEIGHT, MOSAIC_DIM, MOSAIC_QUALITY]
+        for filename in files:
+            try:
+                stat = os.stat(filename)
+                inputs.append([filename, stat.st_size, stat.st_mtime_ns])
+            except OSError:
+                inputs.append([filename])
+        return hashlib.blake2b(json.dumps(inputs).encode(),
+                               digest_size=16).hexdigest()
+
+    def update_group_tiles(self,
+                           catalog: LibraryCatalog,
+                           output_filename: str,
+                           groups: set = None) -> None:
+        """
+        Recompose only the group tiles whose thumbnails changed, as
+        recorded in the group build manifest next to the catalog. When
+        the changed `groups` are known the thumbnails of the others are
+        not checked.
+        """
+        manifest_filename = os.path.join(os.path.dirname(output_filename),
+                                         ".preview", "groups.build.json")
+        built = self._read_manifest(manifest_filename)
+        manifest = {}
+
+        def stale(name: str, files: []) -> bool:
+            """Check the tile of group `name` needs composing."""
+            if groups is not None and name not in groups and name in built:
+                manifest[name] = built[name]
+                return False
+            manifest[name] = self._group_inputs(files)
+            return self.options.force or built.get(name) != manifest[name]
+
+        updated = catalog.update_group_thumbnails(
+            self.generate_tile_thumbnail_file, output_filename, stale,
+            self.options.jobs)
+        log.debug("Updated group tiles %s", updated)
+        if manifest != built:
+            os.makedirs(os.path.dirname(manifest_filename), exist_ok=True)
+            write_atomic(manifest_filename, dump_json(manifest))
+
+    def create_catalog(self,
+                       output_filename: str,
+                       assets: [],
+                       groups: set = None):
         """
         Create a catalog file `output_filename` from the
         asset objects `assets`.
+
+        In incremental mode an existing catalog is loaded and only the
+        added, changed and removed assets are applied to it. Only the
+        tiles of the changed `groups` are checked, when known.
         """
         any_updated = False
         catalog = LibraryCatalog()
         for asset in assets:
-            if not catalog.append(asset):
-                any_updated = any_updated or asset.updated
-                continue
+            catalog.append(asset)
+            any_updated = any_updated or asset.updated
+        # Rewrite a catalog last built with sharding the other way
+        resharded = self.options.sharded != os.path.isdir(
+            catalog.shard_dirname(output_filename))
+        if self.options.incremental and catalog.load(output_filename):
+            changes = catalog.update()
+            print(f"Catalog changes {changes}")
+            any_updated = changes > 0 or resharded
+        else:
+            any_updated = (any_updated or resharded
+                           or not os.path.exists(output_filename))
+            if any_updated:
+                catalog.build()
 
-        catalog.update_group_thumbnails(self.generate_tile_thumbnail_file,
-                                        output_filename, any_updated)
+        with metrics.span("group_tiles"):
+            self.update_group_tiles(catalog, output_filename, groups)
         if any_updated:
-            if not os.path.exists(output_filename):
-                print("Building catalog ... ")
-                data = catalog.to_json()
-                with open(output_filename, "w") as cat_file:
-                    cat_file.write(data)
-                print(f"Wrote catalog {output_filename}")
-                print(
-                    f"Total Data Size: {sizeof_fmt(catalog.total_file_size)}")
-                print(f"Total Duration: {time_fmt(catalog.total_duration)}")
-            else:
-                print(f"No updates!")
\ No newline at end of file
+            print("Building catalog ... ")
+            with metrics.span("catalog", outputs=[output_filename]):
+                if self.options.sharded:
+                    # Shards first so the index never names a missing one
+                    shards = catalog.write_shards(output_filename)
+                    write_atomic(output_filename,
+                                 catalog.index_json(self.options.minify))
+                    catalog.prune_shards(output_filename)
+                    print(f"Wrote {shards} catalog shards")
+                else:
+                    write_atomic(output_filename,
+                                 catalog.to_json(self.options.minify))
+                    # Stale shards of an earlier sharded build
+                    catalog.prune_shards(output_filename, keep=False)
+            print(f"Wrote catalog {output_filename}")
+            print(f"Total Data Size: {sizeof_fmt(catalog.total_file_size)}")
+            print(f"Total Duration: {time_fmt(catalog.total_duration)}")
+        else:
+            print(f"No updates!")
+        if self.options.precompress and os.path.exists(output_filename):
+            filenames = [output_filename]
+            if self.options.sharded:
+                filenames += [
+                    catalog.shard_filename(output_filename, name)
+                    for name in catalog.groups
+                ]
+            self.precompress_files(filenames)
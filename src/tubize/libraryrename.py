@@ -0,0 +1,216 @@
+"""
+Rename videos and their previews as one journaled transaction.
+
+Affected videos are found through the catalog rather than by walking
+the tree. The whole rename is planned up front as a list of moves, with
+edited files (VTT, metas and the catalog) staged in the journal
+directory, so an interrupted rename can be resumed or rolled back.
+"""
+import os
+import json
+import shutil
+import logging
+
+from .libraryasset import LibraryAsset
+from .librarycatalog import LibraryCatalog
+from .utils import write_atomic, dump_json, PRECOMPRESSED_EXTS
+
+log = logging.getLogger(__name__)
+
+JOURNAL_DIR = ".rename"
+
+
+class LibraryRename:
+    """Journaled rename of the videos in a library."""
+    def __init__(self, root: str):
+        self.root = os.path.normpath(root)
+        self.catalog_filename = os.path.join(self.root, "catalog.json")
+        self.journal_dir = os.path.join(self.root, JOURNAL_DIR)
+        self.journal_filename = os.path.join(self.journal_dir,
+                                             "journal.json")
+
+    @property
+    def pending(self) -> bool:
+        """Check for an unfinished rename."""
+        return os.path.exists(self.journal_filename)
+
+    def _asset(self, uri: str) -> LibraryAsset:
+        """Get the asset of a catalog entry."""
+        return LibraryAsset(os.path.join(self.root, *uri.split("/")) +
+                            ".mp4")
+
+    def _group_thumbnail(self, name: str) -> str:
+        """Get the group thumbnail path as written in the catalog."""
+        return f'{self.root}/{name}.jpg'
+
+    def plan(self, pattern: str, replace: str) -> []:
+        """
+        Plan renaming the catalog videos (and groups) containing
+        `pattern`, staging edited files and writing the journal.
+        Returns the planned (source, destination) moves.
+        """
+        if self.pending:
+            raise ValueError(f"Unfinished rename in {self.journal_dir}")
+        if not pattern or "/" in pattern + replace or os.path.sep in (
+                pattern + replace):
+            raise ValueError("Pattern must be part of a file name")
+        catalog = LibraryCatalog()
+        if not catalog.load(self.catalog_filename):
+            raise ValueError(f"Unable to load {self.catalog_filename}")
+        shutil.rmtree(self.journal_dir, ignore_errors=True)
+        os.makedirs(self.journal_dir)
+        moves = []
+
+        def backup_file(source: str):
+            """Move any `source` and its precompressed variants into the
+            journal, as the variants would be stale."""
+            for ext in ("", *PRECOMPRESSED_EXTS):
+                filename = source + ext
+                if os.path.exists(filename):
+                    moves.append((filename,
+                                  os.path.join(self.journal_dir,
+                                               f"{len(moves)}.old")))
+
+        def replace_file(source: str, destination: str, text: str):
+            """Back up any `source` and move staged `text` to `destination`."""
+            staged = os.path.join(self.journal_dir, f"{len(moves)}.new")
+            with open(staged, "w") as staged_file:
+                staged_file.write(text)
+            backup_file(source)
+            moves.append((staged, destination))
+
+        groups = {}
+        uris = [e['_'] for g in catalog.groups.values() for e in g['assets']]
+        for uri in uris:
+            new_uri = uri.replace(pattern, replace)
+            if new_uri == uri:
+                continue
+            src, dst = self._asset(uri), self._asset(new_uri)
+            print(f"{src.filename} --> {dst.filename}")
+            for source, destination in zip([
+                    src.filename, src.tile_image_filename, src.webp_filename,
+                    src.scrub_image_filename, src.scenes_filename,
+                    src.manifest_filename
+            ], [
+                    dst.filename, dst.tile_image_filename, dst.webp_filename,
+                    dst.scrub_image_filename, dst.scenes_filename,
+                    dst.manifest_filename
+            ]):
+                for ext in ("", *PRECOMPRESSED_EXTS):
+                    if os.path.exists(source + ext):
+                        moves.append((source + ext, destination + ext))
+            pages = src.scrub_pages
+            for page in range(1, pages):
+                moves.append((src.scrub_page_filename(page),
+                              dst.scrub_page_filename(page)))
+            if os.path.exists(src.vtt_filename):
+                with open(src.vtt_filename, "r") as vtt_file:
+                    vtt = vtt_file.read()
+                for page in range(max(pages, 1)):
+                    vtt = vtt.replace(f"{src.scrub_page_uri(page)}#",
+                                      f"{dst.scrub_page_uri(page)}#")
+                replace_file(src.vtt_filename, dst.vtt_filename, vtt)
+            if os.path.exists(src.meta_filename):
+                with open(src.meta_filename, "r") as meta_file:
+                    text = meta_file.read()
+                meta = json.loads(text)
+                meta.update({
+                    "title": dst.attributes.title,
+                    "description": dst.attributes.description,
+                    "tags": dst.attributes.keywords
+                })
+                replace_file(src.meta_filename, dst.meta_filename,
+                             dump_json(meta, "\n" not in text))
+            catalog.rename(uri, dst)
+            groups[src.group] = dst.group
+
+        for old, new in groups.items():
+            thumbnail = self._group_thumbnail(old)
+            if (old not in catalog.groups and old != new
+                    and os.path.exists(thumbnail)
+                    and 'thumbnail' not in catalog.groups[new]):
+                moves.append((thumbnail, self._group_thumbnail(new)))
+                catalog.groups[new]['thumbnail'] = self._group_thumbnail(new)
+        with open(self.catalog_filename, "r") as cat_file:
+            minify = "\n" not in cat_file.read()
+        if moves and catalog.sharded:
+            for name in sorted(catalog.changed):
+                shard = catalog.shard_filename(self.catalog_filename, name)
+                if name in catalog.groups:
+                    replace_file(shard, shard, catalog.shard_json(name))
+                else:
+                    backup_file(shard)
+            replace_file(self.catalog_filename, self.catalog_filename,
+                         catalog.index_json(minify))
+        elif moves:
+            replace_file(self.catalog_filename, self.catalog_filename,
+                         catalog.to_json(minify))
+
+        # Only a file already moved out of the way may be replaced
+        present, clashes = {}, set()
+        for source, destination in moves:
+            if present.get(destination, os.path.exists(destination)):
+                clashes.add(destination)
+            present[source], present[destination] = False, True
+        if clashes:
+            shutil.rmtree(self.journal_dir)
+            raise ValueError(f"Rename would overwrite {sorted(clashes)}")
+        self._write_journal({
+            "pattern": pattern,
+            "replace": replace,
+            "moves": moves,
+            "done": 0
+        })
+        return moves
+
+    def _read_journal(self) -> {}:
+        """Load the journal of the unfinished rename."""
+        with open(self.journal_filename, "r") as journal_file:
+            return json.load(journal_file)
+
+    def _write_journal(self, journal: {}) -> None:
+        """Record the progress of the rename."""
+        write_atomic(self.journal_filename, json.dumps(journal))
+
+    def apply(self) -> None:
+        """Apply (or resume) the planned moves then drop the journal."""
+        journal = self._read_journal()
+        moves = journal["moves"]
+        for i in range(journal["done"], len(moves)):
+            source, destination = moves[i]
+            # A crash between a move and its journal update leaves the
+            # move done but not recorded
+            if os.path.exists(source) or not os.path.exists(destination):
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.rename(source, destination)
+                log.debug("Renamed %s to %s", source, destination)
+            journal["done"] = i + 1
+            self._write_journal(journal)
+        shutil.rmtree(self.journal_dir)
+        for source, _ in moves:
+            self._remove_empty_dir(os.path.dirname(source))
+        print(f"Renamed {len(moves)} files")
+
+    def rollback(self) -> None:
+        """Undo the applied moves of an unfinished rename."""
+        journal = self._read_journal()
+        moves = journal["moves"]
+        for i in reversed(range(min(journal["done"] + 1, len(moves)))):
+            source, destination = moves[i]
+            if os.path.exists(destination) and not os.path.exists(source):
+                os.rename(destination, source)
+                log.debug("Restored %s from %s", source, destination)
+            journal["done"] = i
+            self._write_journal(journal)
+        shutil.rmtree(self.journal_dir)
+        for _, destination in moves:
+            self._remove_empty_dir(os.path.dirname(destination))
+        print(f"Rolled back {journal['pattern']} -> {journal['replace']}")
+
+    def _remove_empty_dir(self, path: str) -> None:
+        """Remove a group (or group preview) folder left empty."""
+        if path != self.root and path.startswith(self.root):
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
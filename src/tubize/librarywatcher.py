@@ -0,0 +1,277 @@
+"""
+Keep a library up to date as videos are added, changed or removed.
+
+The scanned state is kept in memory so each pass only stats the tree
+and processes the videos that changed. Changes are noticed through
+inotify when the optional inotify_simple package is installed (Linux),
+only the directories with events then being stat'ed, otherwise the tree
+is polled.
+"""
+import os
+import time
+import logging
+
+from . import metrics
+from .libraryasset import LibraryAsset
+from .librarymaker import LibraryMaker
+from .utils import walk_files, file_signature
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+log = logging.getLogger(__name__)
+
+
+class PollNotifier:
+    """Wake up the watcher every poll interval."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def wait(self, timeout: float):
+        """Sleep until the next scan is due, which covers the tree."""
+        time.sleep(timeout)
+        return None
+
+    def close(self) -> None:
+        """Nothing to release."""
+        pass
+
+
+class INotifier:
+    """Wake up the watcher when anything below the path changes."""
+    def __init__(self, path: str):
+        self.path = path
+        self.inotify = inotify_simple.INotify()
+        flags = inotify_simple.flags
+        self.mask = (flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_FROM
+                     | flags.MOVED_TO | flags.DELETE)
+        self.watches = {}
+        self._watch_tree(path)
+
+    def _watch_tree(self, path: str) -> None:
+        """Watch `path` and its non hidden sub directories."""
+        try:
+            self.watches[self.inotify.add_watch(path, self.mask)] = path
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name[0] != "." and entry.is_dir(
+                            follow_symlinks=False):
+                        self._watch_tree(entry.path)
+        except OSError as error:
+            log.debug("Unable to watch %s - %s", path, error)
+
+    def wait(self, timeout: float):
+        """
+        Block until something changes or `timeout` seconds pass. Returns
+        the directories with changed videos mapped to whether they must
+        be searched recursively, or None when events were lost.
+        """
+        flags = inotify_simple.flags
+        events = self.inotify.read(timeout=int(timeout * 1000),
+                                   read_delay=100)
+        dirs = {}
+        for event in events:
+            if event.mask & flags.Q_OVERFLOW:
+                return None
+            if event.mask & flags.IGNORED:
+                self.watches.pop(event.wd, None)
+                continue
+            if event.wd not in self.watches or event.name[:1] in ("", "."):
+                continue
+            path = os.path.join(self.watches[event.wd], event.name)
+            if event.mask & flags.ISDIR:
+                # Added, moved or removed with everything below it
+                dirs[path] = True
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    self._watch_tree(path)
+            elif os.path.normcase(event.name).endswith(
+                    os.path.normcase(".mp4")):
+                dirs.setdefault(self.watches[event.wd], False)
+        return dirs
+
+    def close(self) -> None:
+        """Release the inotify descriptor."""
+        self.inotify.close()
+
+
+class LibraryWatcher:
+    """Incrementally rebuild a library whenever its videos change."""
+    def __init__(self, maker: LibraryMaker, path: str):
+        self.maker = maker
+        self.path = os.path.normpath(path)
+        self.catalog_filename = os.path.join(self.path, "catalog.json")
+        self.poll_interval = maker.options.poll_interval
+        self.settle_time = maker.options.settle_time
+        # Only the changed assets are handed to the catalog as updated
+        # so it is always updated in place.
+        maker.options.incremental = True
+        self.known = {}
+        self.assets = {}
+
+    def notifier(self):
+        """Use inotify when available, otherwise poll."""
+        if inotify_simple is not None:
+            try:
+                return INotifier(self.path)
+            except OSError as error:
+                log.warning("Unable to use inotify - %s", error)
+        return PollNotifier(self.path)
+
+    @staticmethod
+    def _search(path: str, recursive: bool) -> []:
+        """Find the videos in directory `path`."""
+        if recursive:
+            return list(walk_files(path, "mp4")) if os.path.isdir(path) else []
+        try:
+            with os.scandir(path) as entries:
+                return sorted(
+                    e.path for e in entries if e.name[0] != "."
+                    and os.path.normcase(e.name).endswith(
+                        os.path.normcase(".mp4")) and e.is_file())
+        except OSError:
+            return []
+
+    @staticmethod
+    def _covers(dirs: {}, filename: str) -> bool:
+        """Check a search of `dirs` would find `filename` if it exists."""
+        path = os.path.dirname(filename)
+        if path in dirs:
+            return True
+        return any(filename.startswith(d + os.path.sep)
+                   for d, recursive in dirs.items() if recursive)
+
+    def scan(self, dirs: {} = None) -> ([], [], bool):
+        """
+        Stat the tree, or only `dirs` mapped to whether to search them
+        recursively, returning the settled videos that are new or
+        changed, the removed videos and whether any video is still
+        being written.
+        """
+        now = time.time()
+        if dirs is None:
+            dirs = {self.path: True}
+        changed = []
+        settling = False
+        found = set()
+        for path, recursive in sorted(dirs.items()):
+            found.update(self._search(path, recursive))
+        for filename in sorted(found):
+            try:
+                signature = file_signature(filename)
+            except OSError:
+                continue
+            if signature == self.known.get(filename):
+                continue
+            if now - signature["mtime"] < self.settle_time:
+                settling = True
+                continue
+            changed.append((filename, signature))
+        removed = [
+            f for f in self.known if f not in found and self._covers(dirs, f)
+        ]
+        return changed, removed, settling
+
+    def process(self, filenames: []) -> []:
+        """
+        Create artifacts for `filenames`, logging the videos that fail
+        so the others still make it into the catalog.
+        """
+        if self.maker.options.jobs > 1 and len(filenames) > 1:
+            try:
+                return self.maker.add_videos_parallel(filenames,
+                                                      self.maker.options.jobs)
+            except Exception as error:  # pylint: disable=broad-except
+                # Videos already done are reused below
+                log.error("Unable to process videos in parallel - %s", error)
+        assets = []
+        for filename in filenames:
+            try:
+                assets.append(self.maker.add_video(filename))
+            except Exception as error:  # pylint: disable=broad-except
+                log.error("Unable to process %s - %s", filename, error)
+        return assets
+
+    def apply(self, changed: [], removed: []) -> []:
+        """
+        Create artifacts for changed videos and update the catalog.
+        Returns the videos that failed, to be retried.
+        """
+        for asset in self.assets.values():
+            asset.updated = False
+        for filename in removed:
+            print(f"Removed {filename}")
+            self.known.pop(filename)
+            self.assets.pop(filename, None)
+        signatures = dict(changed)
+        for filename in signatures:
+            if filename in self.known:
+                # Content replaced in place, existing previews are stale.
+                for stale in LibraryAsset(filename).artifact_filenames:
+                    if os.path.exists(stale):
+                        os.remove(stale)
+        for asset in self.process(list(signatures)):
+            # Only recorded once processed so failures are retried
+            self.known[asset.filename] = signatures[asset.filename]
+            self.assets[asset.filename] = asset
+        failed = [f for f in signatures if self.known.get(f) != signatures[f]]
+        for filename in failed:
+            self.assets.pop(filename, None)
+        groups = {LibraryAsset(f).group for f in list(signatures) + removed}
+        self.maker.create_catalog(self.catalog_filename,
+                                  sorted(self.assets.values(),
+                                         key=lambda a: a.filename),
+                                  groups=groups)
+        self.flush_metrics()
+        return failed
+
+    def flush_metrics(self) -> None:
+        """Export the spans of the last pass, dropping them so a long
+        running watch does not accumulate them."""
+        metrics_out = self.maker.options.metrics_out
+        if metrics_out:
+            metrics.write_metrics(metrics_out)
+            trace_file = os.path.splitext(metrics_out)[0]
+            metrics.write_trace(f"{trace_file}.trace.json")
+        metrics.collect()
+
+    def run(self, passes: int = None) -> None:
+        """
+        Watch the library until interrupted (or for `passes` scans),
+        processing videos once they stop being written to.
+        """
+        print(f"Watching {self.path} for videos ...")
+        notifier = self.notifier()
+        # The first pass covers the whole tree
+        dirs = None
+        try:
+            while passes is None or passes > 0:
+                try:
+                    changed, removed, settling = self.scan(dirs)
+                    failed = (self.apply(changed, removed)
+                              if changed or removed else [])
+                except Exception as error:  # pylint: disable=broad-except
+                    log.error("Unable to update %s - %s", self.path, error)
+                    # Scan the whole tree again on the next pass
+                    settling, failed = False, None
+                    metrics.collect()
+                if passes is not None:
+                    passes -= 1
+                    if not passes:
+                        break
+                if settling:
+                    # Look at the same directories once they settle
+                    time.sleep(self.settle_time)
+                    continue
+                events = notifier.wait(self.poll_interval)
+                if events is None or failed is None:
+                    dirs = None
+                else:
+                    dirs = events
+                    for filename in failed:
+                        dirs.setdefault(os.path.dirname(filename), False)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+        finally:
+            notifier.close()
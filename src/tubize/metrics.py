@@ -0,0 +1,206 @@
+"""
+Timing spans for library stages and the commands they run.
+
+Each span records wall time, CPU time of child processes, peak resident
+memory and bytes written to its outputs. Finished spans are kept per
+process and exported as a JSON summary or a Chrome trace file
+(chrome://tracing, Perfetto).
+"""
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+import collections
+import logging
+try:
+    import resource
+except ImportError:
+    resource = None
+
+log = logging.getLogger(__name__)
+
+_SPANS = []
+_START = time.time()
+
+
+def children_cpu_time() -> float:
+    """Get user plus system CPU time of terminated child processes."""
+    if not resource:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_kb(maxrss: int) -> int:
+    """Convert a `ru_maxrss` value to KiB, as macOS reports bytes."""
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def max_rss() -> int:
+    """
+    Get the peak resident memory in KiB of this process or of the
+    largest terminated child process, whichever is larger.
+    """
+    if not resource:
+        return 0
+    return rss_kb(
+        max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
+
+
+@contextlib.contextmanager
+def span(name: str, category: str = "stage", outputs: [] = None, **args):
+    """
+    Time the enclosed block as span `name`.
+
+    Sizes of any existing `outputs` files are recorded as bytes written
+    once the block ends. Keyword `args` are kept with the span and the
+    yielded record may be updated with more. Child CPU time covers all
+    children finishing during the span so overlaps with concurrent work,
+    unless the record is given the `cpu_time` of its own command.
+
+    Peak memory is the high water mark of this process and its children
+    once the span ends, with how far the span raised it, unless given
+    the `peak_rss_kb` of its own command.
+    """
+    record = {
+        "name": name,
+        "category": category,
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "start": time.time(),
+        "args": args
+    }
+    cpu_start = children_cpu_time()
+    rss_start = max_rss()
+    try:
+        yield record
+    finally:
+        record["wall_time"] = time.time() - record["start"]
+        record.setdefault("cpu_time", children_cpu_time() - cpu_start)
+        rss = max_rss()
+        record.setdefault("peak_rss_kb", rss)
+        record["rss_growth_kb"] = rss - rss_start
+        record["bytes_written"] = sum(
+            os.path.getsize(f) for f in outputs or [] if os.path.exists(f))
+        _SPANS.append(record)
+        log.debug("%s %s took %.2fs", category, name, record["wall_time"])
+
+
+def timed(name: str, iterable, category: str = "stage", **args):
+    """
+    Yield the items of `iterable` as span `name` timing only the wall
+    time spent producing them, e.g. files found by a walk consumed
+    lazily while they are processed.
+    """
+    record = {
+        "name": name,
+        "category": category,
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "start": time.time(),
+        "args": args
+    }
+    elapsed, count = 0.0, 0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.time() - start
+            count += 1
+            yield item
+    finally:
+        record["args"]["items"] = count
+        record["wall_time"] = elapsed
+        record["cpu_time"] = 0.0
+        record["peak_rss_kb"] = max_rss()
+        record["rss_growth_kb"] = 0
+        record["bytes_written"] = 0
+        _SPANS.append(record)
+        log.debug("%s %s took %.2fs", category, name, elapsed)
+
+
+def collect() -> []:
+    """Remove and return the spans recorded by this process."""
+    spans = list(_SPANS)
+    del _SPANS[:]
+    return spans
+
+
+def extend(spans: []) -> None:
+    """Add spans recorded by another (worker) process."""
+    _SPANS.extend(spans)
+
+
+def summary() -> {}:
+    """Summarise spans per category and name with the slowest videos."""
+    stages = collections.OrderedDict()
+    for record in _SPANS:
+        key = f'{record["category"]}:{record["name"]}'
+        stage = stages.setdefault(key, {
+            "count": 0,
+            "wall_time": 0.0,
+            "cpu_time": 0.0,
+            "max_wall_time": 0.0,
+            "max_peak_rss_kb": 0,
+            "max_rss_growth_kb": 0,
+            "bytes_written": 0
+        })
+        stage["count"] += 1
+        stage["wall_time"] += record["wall_time"]
+        stage["cpu_time"] += record["cpu_time"]
+        stage["bytes_written"] += record["bytes_written"]
+        stage["max_wall_time"] = max(stage["max_wall_time"],
+                                     record["wall_time"])
+        stage["max_peak_rss_kb"] = max(stage["max_peak_rss_kb"],
+                                       record["peak_rss_kb"])
+        stage["max_rss_growth_kb"] = max(stage["max_rss_growth_kb"],
+                                         record["rss_growth_kb"])
+    videos = [r for r in _SPANS if r["name"] == "video"]
+    slowest = sorted(videos, key=lambda r: r["wall_time"], reverse=True)
+    run_time = time.time() - _START
+    return {
+        "run_time": run_time,
+        "videos": len(videos),
+        "videos_per_hour": len(videos) * 3600 / run_time if run_time else 0,
+        "stages": stages,
+        "slowest_videos": [{
+            "video": r["args"].get("video"),
+            "wall_time": r["wall_time"]
+        } for r in slowest[:20]]
+    }
+
+
+def write_metrics(filename: str) -> None:
+    """Write the summary and every span as JSON."""
+    with open(filename, "w") as metrics_file:
+        json.dump({"summary": summary(), "spans": _SPANS}, metrics_file,
+                  indent=2)
+
+
+def write_trace(filename: str) -> None:
+    """Write spans as complete events in the Chrome trace format."""
+    events = [{
+        "name": r["name"],
+        "cat": r["category"],
+        "ph": "X",
+        "ts": int((r["start"] - _START) * 1e6),
+        "dur": int(r["wall_time"] * 1e6),
+        "pid": r["pid"],
+        "tid": r["tid"],
+        "args": dict(r["args"],
+                     cpu_time=r["cpu_time"],
+                     peak_rss_kb=r["peak_rss_kb"],
+                     rss_growth_kb=r["rss_growth_kb"],
+                     bytes_written=r["bytes_written"])
+    } for r in _SPANS]
+    with open(filename, "w") as trace_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"},
+                  trace_file)
@@ -0,0 +1,147 @@
+"""
+Compose the group mosaics from the asset thumbnails in process.
+
+Thumbnails are decoded straight to about the mosaic cell size using the
+jpeg decoder's reduced scales and kept in a cache shared by the groups,
+so rebuilding every group mosaic costs little more than one encode each.
+"""
+import os
+import threading
+import collections
+import numpy as np
+import cv2
+
+from .utils import write_atomic
+
+# Mosaic size in pixels and the largest grid side
+MOSAIC_WIDTH = 350
+MOSAIC_HEIGHT = 200
+MOSAIC_DIM = 5
+MOSAIC_QUALITY = 90
+
+# pylint: disable=no-member
+_REDUCED_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8),
+                  (4, cv2.IMREAD_REDUCED_COLOR_4),
+                  (2, cv2.IMREAD_REDUCED_COLOR_2), (1, cv2.IMREAD_COLOR)]
+# pylint: enable=no-member
+
+
+def mosaic_grid(count: int) -> int:
+    """Get the side of the largest square grid `count` images fill."""
+    dim = MOSAIC_DIM
+    while dim > 1 and count < dim * dim:
+        dim -= 1
+    return dim
+
+
+def decode_reduced(filename: str, width: int, source_width: int = 0):
+    """
+    Decode jpeg `filename` at the smallest reduced scale still at least
+    `width` wide, given the expected `source_width`. Returns None when
+    the file can not be decoded.
+    """
+    data = np.fromfile(filename, dtype=np.uint8)
+    for factor, flag in _REDUCED_FLAGS:
+        if source_width // factor < width and factor > 1:
+            continue
+        image = cv2.imdecode(data, flag)  # pylint: disable=no-member
+        # Smaller than expected, try a larger scale
+        if image is None or image.shape[1] >= width or factor == 1:
+            return image
+    return None
+
+
+def fit_image(image, width: int, height: int):
+    """Resize `image` to fit within `width` x `height` keeping its aspect."""
+    scale = min(width / image.shape[1], height / image.shape[0])
+    size = (max(1, round(image.shape[1] * scale)),
+            max(1, round(image.shape[0] * scale)))
+    # pylint: disable=no-member
+    return cv2.resize(image,
+                      size,
+                      interpolation=cv2.INTER_AREA
+                      if scale < 1 else cv2.INTER_LINEAR)
+    # pylint: enable=no-member
+
+
+class ThumbnailCache:
+    """Thread safe LRU cache of thumbnails decoded at a cell size."""
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._images = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Worker processes start with an empty cache
+        return self.__class__, (self.capacity, )
+
+    def get(self,
+            filename: str,
+            width: int,
+            height: int,
+            source_width: int = 0):
+        """
+        Get thumbnail `filename` fitted to `width` x `height`, decoding
+        it unless cached for the current version of the file. Returns
+        None for missing or unreadable files.
+        """
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        key = (filename, stat.st_size, stat.st_mtime_ns, width, height)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+        image = decode_reduced(filename, width, source_width)
+        if image is not None:
+            image = fit_image(image, width, height)
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self.capacity:
+                self._images.popitem(last=False)
+        return image
+
+
+def compose_mosaic(images: [], dim: int, width: int, height: int):
+    """
+    Lay the first `dim` x `dim` fitted `images` out in rows of cells of
+    `width` x `height`, centred on black.
+    """
+    mosaic = np.zeros((dim * height, dim * width, 3), dtype=np.uint8)
+    for i, image in enumerate(images[:dim * dim]):
+        if image is None:
+            continue
+        row, col = divmod(i, dim)
+        y_off = row * height + (height - image.shape[0]) // 2
+        x_off = col * width + (width - image.shape[1]) // 2
+        mosaic[y_off:y_off + image.shape[0],
+               x_off:x_off + image.shape[1]] = image
+    return mosaic
+
+
+def write_mosaic(files: [],
+                 output_filename: str,
+                 cache: ThumbnailCache,
+                 source_width: int = 0) -> bool:
+    """
+    Write a mosaic jpeg of the thumbnail `files` to `output_filename`.
+    Returns False when there is nothing to compose.
+    """
+    if not files:
+        return False
+    dim = mosaic_grid(len(files))
+    width, height = MOSAIC_WIDTH // dim, MOSAIC_HEIGHT // dim
+    images = [
+        cache.get(f, width, height, source_width) for f in files[:dim * dim]
+    ]
+    if all(image is None for image in images):
+        return False
+    mosaic = compose_mosaic(images, dim, width, height)
+    # pylint: disable=no-member
+    _, data = cv2.imencode(".jpg", mosaic,
+                           [cv2.IMWRITE_JPEG_QUALITY, MOSAIC_QUALITY])
+    # pylint: enable=no-member
+    write_atomic(output_filename, data.tobytes())
+    return True
@@ -35,6 +35,12 @@ class Options(object):
         """Sub class adds."""
         pass
 
+    def __getstate__(self):
+        """Drop the parser so options can be sent to worker processes."""
+        state = self.__dict__.copy()
+        state.pop('parser', None)
+        return state
+
     def parse(self):
         """Extract options from the command line."""
         args = self.parser.parse_args()
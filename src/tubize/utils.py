@@ -1,39 +1,348 @@
 import os
 import sys
-from pathlib import Path
-import time
+import gzip
+import json
 import shlex
+import asyncio
+import contextlib
+import collections
 import subprocess
+import threading
+import hashlib
+import shutil
 import logging
 
+from .metrics import span, rss_kb
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 log = logging.getLogger(__name__)
 
+PRECOMPRESSED_EXTS = (".gz", ".br")
+
+CallResult = collections.namedtuple(
+    'CallResult', 'returncode stdout stderr wall_time cpu_time')
+
+FFMPEG = "ffmpeg -hwaccel auto -hide_banner -loglevel error -y"
+
+# Threads given to each kind of command, 0 to share the core budget
+# between the commands run together (all of it for a command run on its
+# own). libwebp_anim and image encodes are single threaded while decodes
+# and x264 transcodes use every core they are given.
+THREAD_PROFILES = {"decode": 0, "encode": 1, "transcode": 0}
+
+_THREAD_PROFILES = dict(THREAD_PROFILES)
+
+
+def set_call_limit(limit: int) -> int:
+    """Set the core budget shared by the commands `call_async` runs at
+    once, returning the previous budget."""
+    return _CALL_SLOTS.resize(max(1, int(limit)))
+
+
+def parse_thread_profiles(spec: str) -> {}:
+    """Parse per profile thread counts written as `decode=2,encode=1`."""
+    profiles = {}
+    for item in filter(None, spec.split(",")):
+        name, _, threads = item.partition("=")
+        name = name.strip()
+        if name not in THREAD_PROFILES or int(threads) < 0:
+            raise ValueError(f"Invalid thread profile {item}")
+        profiles[name] = int(threads)
+    return profiles
+
+
+def set_thread_profiles(profiles: {}) -> {}:
+    """Override the threads of resource profiles, returning the previous
+    profiles."""
+    previous = dict(_THREAD_PROFILES)
+    _THREAD_PROFILES.update(profiles)
+    return previous
+
+
+def profile_threads(profile: str, share: int = 1) -> int:
+    """Get the threads a command of `profile` is given within the budget
+    when `share` commands are run together."""
+    threads = _THREAD_PROFILES[profile]
+    if threads:
+        return min(threads, _CALL_SLOTS.total)
+    return max(1, _CALL_SLOTS.total // max(1, share))
+
+
+def threaded_args(args: str, profile: str, share: int = 1) -> (str, int):
+    """
+    Give ffmpeg `args` the filter threads of `profile` and split its
+    threads between the decoders of every input. Returns the arguments
+    and the threads of the budget the command holds.
+    """
+    threads = profile_threads(profile, share)
+    argv = shlex.split(args)
+    inputs = max(1, argv.count("-i"))
+    per_input = max(1, threads // inputs)
+    threaded = []
+    for arg in argv:
+        if arg == "-i":
+            threaded += ["-threads", str(per_input)]
+        threaded.append(arg)
+    return (f"-filter_threads {threads} -filter_complex_threads {threads} "
+            f"{shlex.join(threaded)}", max(threads, per_input * inputs))
+
+
+class _CallSlots:
+    """
+    Cores of the budget taken by the running commands, shared by every
+    thread and event loop of the process.
+    """
+    def __init__(self, total: int):
+        self.total = total
+        self.free = total
+        self.lock = threading.Lock()
+        self.waiters = set()
+
+    def resize(self, total: int) -> int:
+        """Change the budget, returning the previous total."""
+        with self.lock:
+            previous = self.total
+            self.free += total - previous
+            self.total = total
+        self._notify()
+        return previous
+
+    def _try_take(self, count: int, waiter) -> bool:
+        """Take `count` cores if free, otherwise register `waiter` to be
+        woken when cores are released."""
+        with self.lock:
+            if self.free >= count:
+                self.free -= count
+                self.waiters.discard(waiter)
+                return True
+            self.waiters.add(waiter)
+            return False
+
+    def _notify(self) -> None:
+        """Wake the waiting commands to try taking their cores again."""
+        with self.lock:
+            waiters = list(self.waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The waiting loop has since closed
+                with self.lock:
+                    self.waiters.discard((loop, event))
+
+    def release(self, count: int) -> None:
+        """Return `count` cores to the budget."""
+        with self.lock:
+            self.free += count
+        self._notify()
+
+    @contextlib.asynccontextmanager
+    async def take(self, count: int):
+        """Wait until `count` cores are free and hold them."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        try:
+            while not self._try_take(count, waiter):
+                await waiter[1].wait()
+                waiter[1].clear()
+        except BaseException:
+            with self.lock:
+                self.waiters.discard(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self.release(count)
+
+
+_CALL_SLOTS = _CallSlots(os.cpu_count() or 1)
+
+
+class _Process(subprocess.Popen):
+    """Process keeping its own resource usage once reaped."""
+    rusage = None
+
+    def _try_wait(self, wait_flags):
+        if not hasattr(os, "wait4"):
+            return super()._try_wait(wait_flags)
+        try:
+            pid, status, rusage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            # Reaped elsewhere, the status is lost
+            return self.pid, 0
+        if pid:
+            self.rusage = rusage
+        return pid, status
+
+
+def _run_process(argv: [], cwd, timeout: float) -> (_Process, bytes, bytes):
+    """Run `argv` to completion, killing it after `timeout` seconds."""
+    process = _Process(argv,
+                       stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE,
+                       cwd=cwd)
+    try:
+        std_out, std_err = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise subprocess.TimeoutExpired(argv, timeout)
+    return process, std_out, std_err
+
+
+async def call_async(args: str,
+                     cwd=os.path.curdir,
+                     binary: bool = False,
+                     timeout: float = None,
+                     check: bool = False,
+                     threads: int = 1) -> CallResult:
+    """
+    Executes a system command once the `threads` cores it uses are free
+    in the shared budget, so concurrent commands never oversubscribe it.
+
+    The process is killed and `subprocess.TimeoutExpired` raised if it
+    runs longer than `timeout` seconds. A non zero return code raises
+    `subprocess.CalledProcessError` when `check` is set. CPU time and
+    peak memory are those of the command itself where the platform
+    reports them, otherwise CPU time is taken from the children usage
+    so overlaps with concurrent commands.
+    """
+    argv = shlex.split(args)
+    async with _CALL_SLOTS.take(min(max(1, threads), _CALL_SLOTS.total)):
+        log.debug("Exec -> %s", argv)
+        with span(os.path.basename(argv[0]), "command",
+                  command=args) as record:
+            # Reaped in a worker thread to keep the usage of the process
+            process, std_out, std_err = await asyncio.get_running_loop(
+            ).run_in_executor(None, _run_process, argv, cwd, timeout)
+            record["args"]["returncode"] = process.returncode
+            if process.rusage:
+                usage = process.rusage
+                record["cpu_time"] = usage.ru_utime + usage.ru_stime
+                record["peak_rss_kb"] = rss_kb(usage.ru_maxrss)
+        result = CallResult(
+            returncode=process.returncode,
+            stdout=std_out if binary else std_out.decode('utf-8', 'replace'),
+            stderr=std_err.decode('utf-8', 'replace'),
+            wall_time=record["wall_time"],
+            cpu_time=record["cpu_time"])
+    if not binary:
+        log.debug("Exec Result -> %s", result.stdout)
+    if check and result.returncode:
+        raise subprocess.CalledProcessError(result.returncode, argv,
+                                            result.stdout, result.stderr)
+    return result
+
 
-def ffmpeg(args: str) -> (str, int):
-    """Invoke ffmpeg system command."""
-    stout, _, delta = call(
-        f'ffmpeg -hwaccel auto -hide_banner -loglevel error -y {args}')
+async def ffmpeg_async(args: str,
+                       profile: str = "decode",
+                       **kwargs) -> CallResult:
+    """Invoke ffmpeg system command with `call_async`, threaded for its
+    resource `profile`."""
+    args, threads = threaded_args(args, profile)
+    return await call_async(f'{FFMPEG} {args}', threads=threads, **kwargs)
+
+
+def call_sync(args: str, **kwargs) -> CallResult:
+    """Run `call_async` to completion from synchronous code."""
+    return asyncio.run(call_async(args, **kwargs))
+
+
+def call_many(commands: [], **kwargs) -> []:
+    """
+    Run `commands` concurrently within the shared budget, returning a
+    `CallResult` or raised exception for each in order.
+    """
+    async def run_all():
+        return await asyncio.gather(
+            *[call_async(command, **kwargs) for command in commands],
+            return_exceptions=True)
+
+    return asyncio.run(run_all())
+
+
+def ffmpeg_many(args: [], profile: str = "decode", **kwargs) -> []:
+    """
+    Invoke ffmpeg system commands of `profile` concurrently, returning a
+    `CallResult` or raised exception for each in order. As many run at
+    once as their threads fit the budget.
+    """
+    commands = [threaded_args(a, profile, len(args)) for a in args]
+
+    async def run_all():
+        return await asyncio.gather(*[
+            call_async(f'{FFMPEG} {a}', threads=threads, **kwargs)
+            for a, threads in commands
+        ],
+                                    return_exceptions=True)
+
+    return asyncio.run(run_all())
+
+
+def ffmpeg(args: str,
+           binary: bool = False,
+           timeout: float = None,
+           profile: str = "decode") -> (str, int):
+    """Invoke ffmpeg system command threaded for its resource `profile`."""
+    args, threads = threaded_args(args, profile)
+    stout, _, delta = call(f'{FFMPEG} {args}',
+                           binary=binary,
+                           timeout=timeout,
+                           threads=threads)
     return stout, delta
 
 
-def call(args: str, cwd=os.path.curdir) -> (str, str, int):
+def call(args: str,
+         cwd=os.path.curdir,
+         binary: bool = False,
+         timeout: float = None,
+         threads: int = 1) -> (str, str, int):
     """
     Executes a system command returning stdout and stderr
-    text plus time to complete the operation.
+    text plus time to complete the operation. Stdout is
+    returned as bytes when `binary` is set.
     """
     try:
-        args = shlex.split(args)
-        log.debug("Exec -> %s", args)
-        start = time.time()
-        p_handle = subprocess.Popen(args, stdout=subprocess.PIPE, cwd=cwd)
-        std_out, std_err = p_handle.communicate()
-        lapsed_time = time.time() - start
-        std_out = std_out.decode('utf-8')
-        log.debug("Exec Result -> %s", std_out)
-        return std_out, std_err, lapsed_time
-    except Exception:
-        log.critical("unable to invoke !")
-        sys.exit(404)
+        result = call_sync(args,
+                           cwd=cwd,
+                           binary=binary,
+                           timeout=timeout,
+                           threads=threads)
+    except subprocess.TimeoutExpired:
+        log.error("timed out after %ss -> %s", timeout, args)
+        return b"" if binary else "", "", timeout
+    except Exception as error:  # pylint: disable=broad-except
+        log.error("unable to invoke %s - %s", args, error)
+        return b"" if binary else "", str(error), 0
+    if result.returncode:
+        log.warning("exit code %d -> %s\n%s", result.returncode, args,
+                    result.stderr)
+    return result.stdout, result.stderr, result.wall_time
+
+
+def walk_files(path: str, ext: str):
+    """
+    Yield files in directory `path` matching extension `ext` in path
+    order as they are found. Hidden files are skipped and hidden
+    directories (e.g. .preview) are pruned without being read.
+    """
+    ext = os.path.normcase(f".{str(ext).lower()}")
+    try:
+        with os.scandir(path) as entries:
+            entries = sorted(entries, key=lambda e: e.name)
+    except OSError as error:
+        log.warning("Unable to search %s - %s", path, error)
+        return
+    for entry in entries:
+        if entry.name[0] == ".":
+            log.debug("Ignoring hidden %s", entry.path)
+        elif entry.is_dir(follow_symlinks=False):
+            yield from walk_files(entry.path, ext[1:])
+        elif os.path.normcase(entry.name).endswith(ext):
+            yield entry.path
 
 
 def find_files(path: str, ext: str) -> []:
@@ -41,27 +350,111 @@ def find_files(path: str, ext: str) -> []:
     path = os.path.normpath(path)
     ext = str(ext).lower()
     print(f"Searching {path} for *.{ext} ...")
-    matching_files = sorted(Path(path).glob(f"**/*.{ext}"))
-    for x in matching_files:
-        if x.parent.name[0] == "." or x.name[0] == ".":
-            log.debug("Ignoring hidden file %s", x)
-    matching_files = [
-        str(x) for x in matching_files
-        if x.parent.name[0] != "." and x.name[0] != "."
-    ]
-    return matching_files
+    return list(walk_files(path, ext))
+
+
+def file_signature(filename: str) -> {}:
+    """Get the size and modification time identifying a file version."""
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def file_fingerprint(filename: str, block_size: int = 1 << 16) -> str:
+    """
+    Get a fast partial content hash identifying a file wherever it is,
+    from its size and the blocks at its head, middle and tail.
+    """
+    size = os.path.getsize(filename)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    offsets = {0, max(0, (size - block_size) // 2), max(0, size - block_size)}
+    with open(filename, "rb") as video_file:
+        for offset in sorted(offsets):
+            video_file.seek(offset)
+            digest.update(video_file.read(block_size))
+    return f"{size:x}-{digest.hexdigest()}"
+
+
+def link_or_copy(source: str, destination: str) -> None:
+    """Hard link `source` to `destination`, copying when links are not
+    possible (e.g. across file systems)."""
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def write_atomic(filename: str, data) -> None:
+    """Write text (or bytes) to `filename` via a temporary file so readers
+    never see a partial file."""
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with open(tmp_filename, mode) as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_filename, filename)
+
+
+def dump_json(obj, minify: bool = False) -> str:
+    """Serialise `obj` indented for reading or compact for serving."""
+    if minify:
+        return json.dumps(obj, separators=(',', ':'))
+    return json.dumps(obj, indent=2)
+
+
+def compressors() -> {}:
+    """Map precompressed file extensions to their compress functions,
+    brotli only when the optional package is installed."""
+    variants = {".gz": lambda data: gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = lambda data: brotli.compress(data, quality=11)
+    return variants
+
+
+def precompress(filename: str) -> int:
+    """
+    Write compressed variants of `filename` (e.g. `catalog.json.gz`) for a
+    web server to send as is, skipping variants newer than the file.
+    Returns the number of variants written.
+    """
+    mtime = os.stat(filename).st_mtime
+    data = None
+    written = 0
+    for ext, compress in compressors().items():
+        try:
+            if os.stat(filename + ext).st_mtime >= mtime:
+                continue
+        except OSError:
+            pass
+        if data is None:
+            with open(filename, "rb") as source_file:
+                data = source_file.read()
+        write_atomic(filename + ext, compress(data))
+        written += 1
+    return written
 
 
 def check_dependencies(command_map: {}) -> None:
     """Calls each dependency command and exits if any fail"""
     for name, command in command_map.items():
         try:
-            _, _, _ = call(f"{command}")
+            call_sync(f"{command}")
         except FileNotFoundError:
             print(f"Missing dependency {name}")
             sys.exit(404)
 
 
+def check_ffmpeg_encoders(encoders: []) -> None:
+    """Exits if ffmpeg was built without any of the `encoders`"""
+    stdout, _, _ = call("ffmpeg -hide_banner -encoders")
+    available = [line.split()[1] for line in stdout.splitlines()
+                 if len(line.split()) > 1]
+    for encoder in encoders:
+        if encoder not in available:
+            print(f"Missing ffmpeg encoder {encoder}")
+            sys.exit(404)
+
+
 def sizeof_fmt(num, suffix='B'):
     """Format bytes into human friendly units."""
     for unit in ['', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi', 'Ei', 'Zi']:
@@ -6,20 +6,104 @@ import collections
 import math
 import json
 import logging
-from .utils import time_fmt, call
+from .utils import time_fmt, call, file_signature, file_fingerprint, dump_json
 
 log = logging.getLogger(__name__)
 
 Prop = collections.namedtuple(
-    'Properties', 'fps frames height width aspect_ratio original_date')
+    'Prop', 'fps frames height width aspect_ratio original_date')
+
+DATE_TAGS = [
+    "date_recorded", "date", "com.apple.quicktime.creationdate",
+    "creation_time"
+]
+
+
+def _probe_value(filename,
+                 name,
+                 values,
+                 parse,
+                 default,
+                 level=logging.WARNING):
+    """Parse the first usable of `values`, else log and use `default`."""
+    for value in values:
+        if value is None:
+            continue
+        try:
+            parsed = parse(value)
+            if parsed:
+                return parsed
+        except (TypeError, ValueError, IndexError, ZeroDivisionError):
+            continue
+    log.log(level, "no %s found for '%s' using '%s'", name, filename,
+            default)
+    return default
+
+
+def _parse_rate(value) -> float:
+    """Parse a rational ffprobe rate such as 30000/1001."""
+    numerator, denominator = str(value).split("/")
+    return int(numerator) / int(denominator)
+
+
+def _parse_date(value) -> str:
+    """Parse the date part of a tag such as 2019-11-10T12:00:00Z."""
+    return str(value).strip().replace("T", " ").split()[0]
+
+
+def parse_probe(probe: {}, filename: str = "") -> Prop:
+    """
+    Create properties from `ffprobe -of json` output, falling
+    back field by field when a value is missing or malformed.
+    """
+    stream = (probe.get("streams") or [{}])[0]
+    container = probe.get("format", {})
+    width = _probe_value(filename, "width", [stream.get("width")], int, 100)
+    height = _probe_value(filename, "height", [stream.get("height")], int,
+                          100)
+    fps = _probe_value(
+        filename, "fps",
+        [stream.get("r_frame_rate"),
+         stream.get("avg_frame_rate")], lambda x: round(_parse_rate(x), 3),
+        30.0)
+    durations = [stream.get("duration"), container.get("duration")]
+    frames = _probe_value(
+        filename, "frames",
+        [stream.get("nb_frames")] + durations,
+        lambda x: int(x) if str(x).isdigit() else int(float(x) * fps), 1)
+    aspect_ratio = stream.get("display_aspect_ratio")
+    if not aspect_ratio or aspect_ratio in ["0:1", "N/A"]:
+        divisor = math.gcd(width, height)
+        aspect_ratio = f"{width // divisor}:{height // divisor}"
+    tags = {}
+    for source in [stream.get("tags", {}), container.get("tags", {})]:
+        for key, value in source.items():
+            tags.setdefault(key.lower(), value)
+    original_date = _probe_value(filename, "original date",
+                                 [tags.get(key) for key in DATE_TAGS],
+                                 _parse_date,
+                                 "",
+                                 level=logging.INFO)
+    return Prop(width=width,
+                height=height,
+                aspect_ratio=aspect_ratio,
+                fps=fps,
+                frames=frames,
+                original_date=original_date)
 
 
 class VideoMetaInfo(object):
     """Container for video properties."""
-    def __init__(self, filename):
-        """Uninitialized instance of container."""
+    def __init__(self, filename, cache_filename=None):
+        """
+        Uninitialized instance of container, optionally backed by the
+        meta file `cache_filename` written by `to_json`.
+        """
         self.filename = str(filename)
+        self.cache_filename = cache_filename
         self._props = None
+        self._cached = None
+        self._fingerprint = None
 
     @property
     def fps(self):
@@ -51,36 +135,56 @@ class VideoMetaInfo(object):
         self._get_video_info()
         return self._props.original_date
 
+    @property
+    def fingerprint(self) -> str:
+        """Get the partial content hash of the video."""
+        if self._fingerprint is None:
+            self._fingerprint = file_fingerprint(self.filename)
+        return self._fingerprint
+
+    def load_cache(self) -> bool:
+        """
+        Restore properties from the cache file when it was written for
+        the current size and modification time of the video.
+        """
+        if self._cached is None:
+            self._cached = False
+            if self.cache_filename and os.path.exists(self.cache_filename):
+                try:
+                    with open(self.cache_filename, "r") as cache_file:
+                        meta = json.load(cache_file)
+                    if meta.get("source") == file_signature(self.filename):
+                        self.reuse(meta)
+                        # Probe again for metas with a truncated frame rate
+                        if not isinstance(self._props.fps, float):
+                            self._props = None
+                        # Rewrite metas from before content fingerprints
+                        self._cached = ("fingerprint" in meta
+                                        and self._props is not None)
+                except (ValueError, KeyError, TypeError, OSError):
+                    log.debug("Invalid meta cache %s", self.cache_filename)
+        return self._cached
+
+    def reuse(self, meta: {}) -> None:
+        """Take the properties from the meta of a video with the same
+        content, avoiding another probe."""
+        self._props = Prop(**meta["properties"])
+        self._fingerprint = meta.get("fingerprint", self._fingerprint)
+
     def _get_video_info(self):
         """Extract video properties."""
-        if not self._props:
+        if not self._props and not self.load_cache():
             stdout, _, _ = call(
-                f'ffprobe -v error -select_streams v:0 -show_entries stream=r_frame_rate,nb_frames,height,width,display_aspect_ratio \
-                -of default=nokey=1:noprint_wrappers=1 "{self.filename}"')
-            prop = stdout.split('\n')
-            recorded_date = ""
-            stdout, _, _ = call(f'mediainfo "{self.filename}"')
-            if "Recorded date" in stdout:
-                recorded_date = stdout.split("Recorded date")[1]
-                recorded_date = recorded_date.strip().split()[1]
+                f'ffprobe -v error -select_streams v:0 -show_entries \
+                stream=r_frame_rate,avg_frame_rate,nb_frames,height,width,display_aspect_ratio,duration:stream_tags:format=duration:format_tags \
+                -of json "{self.filename}"')
             try:
-                self._props = Prop(width=int(prop[0]),
-                                   height=int(prop[1]),
-                                   aspect_ratio=prop[2],
-                                   fps=int(
-                                       int(prop[3].split("/")[0]) /
-                                       int(prop[3].split("/")[1])),
-                                   frames=int(prop[4]),
-                                   original_date=recorded_date)
-            except (ValueError, IndexError):
+                probe = json.loads(stdout)
+            except ValueError:
                 log.error("parse failed inspecting response '%s'",
                           self.filename)
-                self._props = Prop(width=100,
-                                   height=100,
-                                   aspect_ratio=1,
-                                   fps=30,
-                                   frames=1,
-                                   original_date=recorded_date)
+                probe = {}
+            self._props = parse_probe(probe, self.filename)
 
     @property
     def name(self) -> str:
@@ -130,16 +234,19 @@ class VideoMetaInfo(object):
         print(f"    Aspect: {self.aspect_ratio}")
         print(f"    Original date: {self.original_date}")
 
-    def to_json(self) -> str:
+    def to_json(self, minify: bool = False) -> str:
         """Create json meta format."""
         meta = {
             "title": self.title,
             "duration": self.duration,
             "originaldate": self.original_date,
             "description": self.description,
-            "tags": self.keywords
+            "tags": self.keywords,
+            "source": file_signature(self.filename),
+            "fingerprint": self.fingerprint,
+            "properties": self._props._asdict()
         }
-        return json.dumps(meta, indent=2)
+        return dump_json(meta, minify)
 
     def calc_scrub_image_properties(self, width) -> (int, int, int):
         """Calculate snapshot interval, column and row count."""
@@ -7,7 +7,7 @@ import sys
 import logging
 
 from .videometainfo import VideoMetaInfo
-from .utils import sizeof_fmt, time_fmt, find_files, check_dependencies, call, ffmpeg
+from .utils import sizeof_fmt, time_fmt, find_files, check_dependencies, call, ffmpeg, profile_threads
 
 logger = logging.getLogger(__name__)
 
@@ -38,10 +38,12 @@ class VideoToMP4:
             print(f'Convert {ext} to MP4 {new_name} ... ')
             meta_info = VideoMetaInfo(video_file)
             rule = VideoToMP4.RULES[ext]
-            flags = "-movflags +faststart -pix_fmt yuv420p"
+            # Encoder threads are an output option
+            threads = profile_threads("transcode")
+            flags = f"-movflags +faststart -pix_fmt yuv420p -threads {threads}"
             ffmpeg(
-                f'-i "{video_file}" {flags} {rule} -metadata date="{meta_info.original_date}" "{new_name}"'
-            )
+                f'-i "{video_file}" {flags} {rule} -metadata date="{meta_info.original_date}" "{new_name}"',
+                profile="transcode")
 
     def file(self, filename: str) -> None:
         logger.debug(f"converting file {filename}")
@@ -0,0 +1,18 @@
+import unittest
+import numpy as np
+import tubize.framescore as T_FS
+
+
+class FrameScoreTestCase(unittest.TestCase):
+    """Test flat frames are detected in a batch."""
+    def test_can_score_frame_batch(self):
+        rng = np.random.default_rng(0)
+        black = np.zeros((90, 160, 3), dtype=np.uint8)
+        gray = np.full((90, 160, 3), 128, dtype=np.uint8)
+        detail = rng.integers(0, 255, (90, 160, 3), dtype=np.uint8)
+        scores = T_FS.score_frames(np.stack([black, gray, detail]))
+        self.assertEqual(list(scores.flat), [True, True, False])
+        self.assertAlmostEqual(scores.brightness[0], 0.0)
+        self.assertAlmostEqual(scores.brightness[1], 128 / 255, places=2)
+        self.assertGreater(scores.sharpness[2], scores.sharpness[1])
+        self.assertEqual(len(T_FS.score_frames(detail).flat), 1)
@@ -8,3 +8,14 @@ class LibraryAssetTestCase(unittest.TestCase):
         self.assertNotEqual(vla_, None)
         self.assertEqual(vla_.name, "test")
         self.assertNotEqual(vla_.attributes, None)
+
+    def test_can_find_asset_from_meta_file(self):
+        vla_ = T_VLA.LibraryAsset("./test/examples/test.mp4")
+        found = T_VLA.LibraryAsset.from_meta_filename(vla_.meta_filename)
+        self.assertEqual(found.filename, vla_.filename)
+
+    def test_can_name_scrub_pages(self):
+        vla_ = T_VLA.LibraryAsset("./test/examples/test.mp4")
+        self.assertEqual(vla_.scrub_page_filename(0),
+                         vla_.scrub_image_filename)
+        self.assertEqual(vla_.scrub_page_uri(2), "test.mp4.2.jpg")
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import tubize.librarycatalog as T_LC
+import tubize.libraryasset as T_LA
+
+
+class LibraryCatalogTestCase(unittest.TestCase):
+    """Test catalog can be updated from asset changes."""
+    def _asset(self, root, name, size, group="videos"):
+        filename = os.path.join(root, group, f"{name}.mp4")
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "wb") as video_file:
+            video_file.write(b"0" * size)
+        asset = T_LA.LibraryAsset(filename)
+        asset.updated = True
+        return asset
+
+    def test_can_update_catalog_incrementally(self):
+        # Duration stands in for a probe, taken from the file size
+        with tempfile.TemporaryDirectory() as tmp, patch.object(
+                T_LA.VideoMetaInfo, "duration",
+                property(lambda self: int(os.path.getsize(self.filename)))):
+            catalog_filename = os.path.join(tmp, "catalog.json")
+            assets = [self._asset(tmp, n, 10) for n in ["a", "b", "c"]]
+            catalog = T_LC.LibraryCatalog()
+            for asset in assets:
+                catalog.append(asset)
+            catalog.build()
+            with open(catalog_filename, "w") as cat_file:
+                cat_file.write(catalog.to_json())
+
+            for asset in assets:
+                asset.updated = False
+            assets[1] = self._asset(tmp, "b", 20)
+            del assets[2]
+            assets.append(self._asset(tmp, "d", 5, group="other"))
+            catalog = T_LC.LibraryCatalog()
+            for asset in assets:
+                catalog.append(asset)
+            with patch.object(T_LC.LibraryCatalog,
+                              "entry",
+                              wraps=T_LC.LibraryCatalog.entry) as entry:
+                self.assertTrue(catalog.load(catalog_filename))
+                self.assertEqual(catalog.update(), 3)
+                self.assertEqual(entry.call_count, 2)
+            videos = catalog.groups["videos"]
+            self.assertEqual([e["_"] for e in videos["assets"]],
+                             ["videos/a", "videos/b"])
+            self.assertEqual(videos["time"], 30)
+            self.assertEqual(catalog.groups["other"]["size"], 5)
+            self.assertEqual(catalog.total_file_size, 35)
+
+    def test_sharded_catalog_rewrites_changed_shards(self):
+        with tempfile.TemporaryDirectory() as tmp, patch.object(
+                T_LA.VideoMetaInfo, "duration",
+                property(lambda self: int(os.path.getsize(self.filename)))):
+            catalog_filename = os.path.join(tmp, "catalog.json")
+            assets = [
+                self._asset(tmp, "a", 10),
+                self._asset(tmp, "b", 10, group="other")
+            ]
+            catalog = T_LC.LibraryCatalog()
+            for asset in assets:
+                catalog.append(asset)
+            catalog.build()
+            self.assertEqual(catalog.write_shards(catalog_filename), 2)
+            with open(catalog_filename, "w") as cat_file:
+                cat_file.write(catalog.index_json())
+
+            for asset in assets:
+                asset.updated = False
+            assets[1] = self._asset(tmp, "b", 20, group="other")
+            catalog = T_LC.LibraryCatalog()
+            for asset in assets:
+                catalog.append(asset)
+            self.assertTrue(catalog.load(catalog_filename))
+            self.assertTrue(catalog.sharded)
+            self.assertEqual(catalog.update(), 1)
+            self.assertEqual(catalog.changed, {"other"})
+            self.assertEqual(catalog.write_shards(catalog_filename), 1)
+            with open(T_LC.LibraryCatalog.shard_filename(
+                    catalog_filename, "other")) as shard_file:
+                self.assertEqual(shard_file.read(),
+                                 catalog.shard_json("other"))
+
+            del catalog.groups["other"]
+            catalog.prune_shards(catalog_filename)
+            self.assertEqual(os.listdir(os.path.join(tmp, T_LC.SHARD_DIR)),
+                             ["videos.json"])
+
+            # Built without sharding, every shard is removed
+            shard_dir = T_LC.LibraryCatalog.shard_dirname(catalog_filename)
+            with open(os.path.join(shard_dir, "videos.json.gz"), "wb"):
+                pass
+            catalog.prune_shards(catalog_filename, keep=False)
+            self.assertFalse(os.path.exists(shard_dir))
+
+    def test_rename_keeps_group_order(self):
+        with tempfile.TemporaryDirectory() as tmp, patch.object(
+                T_LA.VideoMetaInfo, "duration",
+                property(lambda self: int(os.path.getsize(self.filename)))):
+            catalog_filename = os.path.join(tmp, "catalog.json")
+            catalog = T_LC.LibraryCatalog()
+            for group in ["c", "a", "b"]:
+                catalog.append(self._asset(tmp, "v", 10, group=group))
+            catalog.build()
+            with open(catalog_filename, "w") as cat_file:
+                cat_file.write(catalog.to_json())
+
+            catalog = T_LC.LibraryCatalog()
+            self.assertTrue(catalog.load(catalog_filename))
+            catalog.rename("a/v", self._asset(tmp, "w", 10, group="new"))
+            self.assertEqual(list(catalog.groups), ["c", "b", "new"])
+            catalog.rename("new/w", self._asset(tmp, "v", 10, group="a"))
+            self.assertEqual(list(catalog.groups), ["c", "a", "b"])
+            self.assertEqual(catalog.total_duration, 30)
+
+    def test_only_stale_group_thumbnails_are_updated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            catalog_filename = os.path.join(tmp, "catalog.json")
+            catalog = T_LC.LibraryCatalog()
+            for group in ["a", "b", "c"]:
+                catalog.append(self._asset(tmp, "v", 10, group=group))
+            with open(os.path.join(tmp, "a.jpg"), "w") as tile_file:
+                tile_file.write("a")
+            with open(os.path.join(tmp, "b.jpg"), "w") as tile_file:
+                tile_file.write("b")
+            tiled = []
+            updated = catalog.update_group_thumbnails(
+                lambda files, fname: tiled.append(fname), catalog_filename,
+                lambda name, files: name == "b", 2)
+            self.assertEqual(updated, ["b", "c"])
+            self.assertEqual(sorted(tiled), [
+                os.path.join(tmp, "b.jpg"), os.path.join(tmp, "c.jpg")
+            ])
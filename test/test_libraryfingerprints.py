@@ -0,0 +1,66 @@
+import os
+import json
+import tempfile
+import unittest
+import tubize.libraryfingerprints as T_LF
+
+
+class FingerprintIndexTestCase(unittest.TestCase):
+    """Test the fingerprint index is built once and shared by appends."""
+    def test_can_build_and_share_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            preview_dir = os.path.join(tmp, ".preview", "g")
+            os.makedirs(preview_dir)
+            old = os.path.join(preview_dir, "old.mp4.json")
+            with open(old, "w") as meta_file:
+                json.dump({"fingerprint": "abc"}, meta_file)
+            with open(os.path.join(preview_dir, "old.mp4.build.json"),
+                      "w") as manifest_file:
+                json.dump({"fingerprint": "xyz"}, manifest_file)
+
+            index = T_LF.FingerprintIndex(tmp)
+            self.assertEqual(index.build(), 1)
+            self.assertEqual(index.find("abc"), [old])
+            self.assertEqual(index.find("xyz"), [])
+            # Built once, later runs only read the index
+            self.assertEqual(T_LF.FingerprintIndex(tmp).build(), 0)
+
+            # Entries appended by another worker are seen on a miss
+            other = T_LF.FingerprintIndex(tmp)
+            new = os.path.join(preview_dir, "new.mp4.json")
+            other.add("def", new)
+            other.add("abc", new)
+            self.assertEqual(index.find("def"), [new])
+            self.assertEqual(T_LF.FingerprintIndex(tmp).find("abc"),
+                             [old, new])
+
+    def test_can_compact_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            preview_dir = os.path.join(tmp, ".preview", "g")
+            os.makedirs(preview_dir)
+            names = [os.path.join(preview_dir, f"{n}.mp4.json") for n in "abc"]
+            for name in names:
+                with open(name, "w") as meta_file:
+                    json.dump({}, meta_file)
+            index = T_LF.FingerprintIndex(tmp)
+            index.build()
+            for fingerprint, name in [("x", names[0]), ("y", names[1]),
+                                      ("z", names[2])]:
+                index.add(fingerprint, name)
+            # Re-added by another run and since changed or removed
+            other = T_LF.FingerprintIndex(tmp)
+            other.add("x", names[0])
+            other.add("w", names[1])
+            os.remove(names[2])
+
+            index = T_LF.FingerprintIndex(tmp)
+            self.assertEqual(index.build(), 0)
+            self.assertEqual(index.find("x"), [names[0]])
+            self.assertEqual(index.find("y"), [])
+            self.assertEqual(index.find("w"), [names[1]])
+            self.assertEqual(index.find("z"), [])
+            with open(index.filename, "r") as index_file:
+                self.assertEqual(len(index_file.readlines()), 2)
+            # Appends after compacting are still seen
+            other.add("v", names[0])
+            self.assertEqual(index.find("v"), [names[0]])
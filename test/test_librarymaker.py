@@ -0,0 +1,247 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+import numpy as np
+import cv2
+import tubize.librarymaker as T_LM
+from tubize.libraryasset import LibraryAsset
+from tubize.librarycatalog import LibraryCatalog
+
+
+def make_maker(**options):
+    """Create a maker without checking for ffmpeg."""
+    defaults = dict(preview_width=160,
+                    cpu_budget=os.cpu_count(),
+                    thread_profiles={},
+                    scrub_page_size=0,
+                    scrub_page_bytes=0,
+                    segment_length=0,
+                    minify=False)
+    defaults.update(options)
+    with patch.object(T_LM, "check_dependencies"), patch.object(
+            T_LM, "check_ffmpeg_encoders"):
+        return T_LM.LibraryMaker(SimpleNamespace(**defaults))
+
+
+def make_asset(path: str, duration: int = 60, fps: float = 30.0):
+    """Create an asset with probed attributes for a 320x180 video."""
+    asset = LibraryAsset(os.path.join(path, "g", "v.mp4"))
+    asset._attributes = SimpleNamespace(width=320,
+                                        height=180,
+                                        duration=duration,
+                                        fps=fps)
+    os.makedirs(asset.preview_basedir, exist_ok=True)
+    return asset
+
+
+class ScrubPagesTestCase(unittest.TestCase):
+    """Test paged scrub sheets are stored as ffmpeg wrote them."""
+    def test_can_store_fewer_sheets_than_expected(self):
+        maker = make_maker(scrub_page_size=600)
+        with tempfile.TemporaryDirectory() as tmp:
+            asset = make_asset(tmp)
+            # 3x6 tiles a sheet, 40 tiles expected on 3 sheets
+            times = list(range(4, 44))
+            sheets = os.path.join(tmp, "sheets")
+            os.makedirs(sheets)
+            sheet = np.zeros((540, 480, 3), dtype=np.uint8)
+            for page in range(2):
+                cv2.imwrite(os.path.join(sheets, f"scrub{page}.jpg"), sheet)
+            # Left from an earlier, longer, paging
+            with open(asset.scrub_page_filename(2), "wb") as stale:
+                stale.write(b"0")
+
+            stored = maker._store_scrub_pages(asset, times, sheets)
+            self.assertEqual(stored, times[:36])
+            self.assertTrue(os.path.exists(asset.scrub_page_filename(1)))
+            self.assertFalse(os.path.exists(asset.scrub_page_filename(2)))
+
+
+class ScrubGridTestCase(unittest.TestCase):
+    """Test scrub tiles are laid out on one sprite or paged sheets."""
+    def test_can_lay_out_single_sprite(self):
+        maker = make_maker()
+        with tempfile.TemporaryDirectory() as tmp:
+            asset = make_asset(tmp)
+            asset._attributes.calc_scrub_image_properties = (
+                lambda width: (1, 8, 8))
+            self.assertEqual(maker._scrub_grid(asset, 56), (8, 8, 1))
+
+    def test_can_lay_out_pages(self):
+        # 3x6 tiles of 160x90 to a 600px sheet
+        maker = make_maker(scrub_page_size=600)
+        with tempfile.TemporaryDirectory() as tmp:
+            asset = make_asset(tmp)
+            for count, pages in [(0, 1), (10, 1), (18, 1), (36, 2), (37, 3)]:
+                self.assertEqual(maker._scrub_grid(asset, count),
+                                 (3, 6, pages))
+
+
+class ThumbnailTestCase(unittest.TestCase):
+    """Test thumbnail candidates are decoded in growing batches."""
+    def thumbnail_batches(self, flat: bool) -> []:
+        maker = make_maker(proxy_analysis=False)
+        batches = []
+
+        def seek_frames(_, offsets, width, height, proxy=False):
+            batches.append(len(offsets))
+            shape = (len(offsets), height, width, 3)
+            if flat:
+                return np.zeros(shape, dtype=np.uint8), offsets
+            return np.random.randint(0, 255, shape, dtype=np.uint8), offsets
+
+        with tempfile.TemporaryDirectory() as tmp:
+            asset = make_asset(tmp, duration=200)
+            with patch.object(maker, "_seek_frames", seek_frames):
+                maker.generate_thumbnail_file(asset)
+            self.assertTrue(os.path.exists(asset.tile_image_filename))
+        return batches
+
+    def test_can_grow_batches_while_flat(self):
+        self.assertEqual(self.thumbnail_batches(True), [1, 2, 4, 8, 16, 16, 3])
+        self.assertEqual(self.thumbnail_batches(False), [1])
+
+
+class ScrubVttTestCase(unittest.TestCase):
+    """Test scrub cues follow the times of the sampled frames."""
+    def test_can_read_sampled_times(self):
+        stderr = (
+            "[showinfo@scrub @ 0x1] n:   0 pts:      0 pts_time:0.004 s:1\n"
+            "[showinfo@scrub @ 0x1] color_range:tv\n"
+            "[showinfo@scrub @ 0x1] n:   1 pts:  60060 pts_time:1.001 s:1\n")
+        self.assertEqual(T_LM.LibraryMaker._shown_times(stderr, 4),
+                         [4.004, 5.001])
+        self.assertEqual(T_LM.LibraryMaker._shown_times("", 4, [4, 5]),
+                         [4, 5])
+
+    def test_can_write_cues_at_sampled_times(self):
+        maker = make_maker(scrub_page_size=600)
+        with tempfile.TemporaryDirectory() as tmp:
+            # Nominal duration beyond the last sampled frame
+            asset = make_asset(tmp, duration=20, fps=29.97)
+            maker.generate_vtt_file(asset, [4.004, 5.005, 6.006])
+            with open(asset.vtt_filename) as vtt_file:
+                cues = [
+                    line for line in vtt_file.read().splitlines()
+                    if "-->" in line
+                ]
+        self.assertEqual(cues, [
+            "00:00:00.000 --> 00:00:05.005", "00:00:05.005 --> 00:00:06.006",
+            "00:00:06.006 --> 00:00:07.006"
+        ])
+
+
+class SceneSelectionTestCase(unittest.TestCase):
+    """Test scene scores are parsed and a detection step chosen."""
+    def test_can_parse_scene_scores(self):
+        text = ("frame:0    pts:0       pts_time:0\n"
+                "lavfi.scene_score=0.000500\n"
+                "frame:1    pts:1001    pts_time:1.001\n"
+                "lavfi.scene_score=0.250000\n"
+                "frame:2    pts:2002    pts_time:2.0026\n"
+                "lavfi.scene_score=0.750000\n")
+        maker = make_maker()
+        for scores, offset, expected in [
+            ("", 0, []),
+            (text, 0, [[1.001, 0.25], [2.003, 0.75]]),
+            (text, 12.5, [[13.501, 0.25], [14.503, 0.75]]),
+        ]:
+            self.assertEqual(maker._parse_scene_scores(scores, offset),
+                             expected)
+
+    def test_can_choose_scene_step(self):
+        maker = make_maker(default_scene_detection=400)
+        steps_down = [400, 350, 300, 250, 200, 150, 100, 50, 40, 30, 20, 10]
+        too_few_then_many = [[t, 0.5] for t in range(40)]
+        too_few_then_many += [[t, 0.2] for t in range(40, 300)]
+        table = [
+            # Nothing to select, every step down is tried
+            ([], steps_down, 0),
+            # All below the lowest threshold
+            ([[t, 0.005] for t in range(300)], steps_down, 0),
+            # Within the target window on the first step
+            ([[t, 0.5] for t in range(100)], [400], 100),
+            # Exactly at the edges of the window of 61 to 229 frames
+            ([[t, 0.5] for t in range(61)], [400], 61),
+            ([[t, 0.5] for t in range(229)], [400], 229),
+            ([[t, 0.5] for t in range(60)], steps_down, 60),
+            # Too few then too many, raising the step again
+            (too_few_then_many, steps_down[:6] + list(range(155, 200, 5)),
+             300),
+        ]
+        for scores, steps, last_count in table:
+            state = maker._choose_scene_step(scores)
+            self.assertEqual(state.steps, steps)
+            self.assertEqual(state.values[-1], last_count)
+
+
+class SegmentsTestCase(unittest.TestCase):
+    """Test long videos are split into overlapping segments."""
+    def test_can_split_segments(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for length, duration, expected in [
+                # Not segmented
+                (0, 64, [(0, None)]),
+                (20, 24, [(0, None)]),
+                # Exact multiple, the last runs to the end
+                (20, 64, [(0, 20), (20, 20), (40, None)]),
+                # Short tail
+                (20, 70, [(0, 20), (20, 20), (40, 20), (60, None)]),
+            ]:
+                maker = make_maker(segment_length=length)
+                asset = make_asset(tmp, duration=duration)
+                self.assertEqual(maker._segments(asset), expected)
+
+    def test_can_overlap_segment_inputs(self):
+        maker = make_maker(segment_length=20, proxy_analysis=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            asset = make_asset(tmp, duration=70)
+            inputs = [
+                maker._segment_input(asset, start, length, analysis=True)
+                for start, length in maker._segments(asset)
+            ]
+        self.assertEqual([trim for _, trim, _ in inputs], [
+            "trim=start=0:end=20", "trim=start=1:end=21",
+            "trim=start=1:end=21", "trim=start=1"
+        ])
+        self.assertTrue(inputs[0][0].startswith("-ss 4 -t 21 -i"))
+        self.assertTrue(inputs[1][0].startswith("-ss 23 -t 22 -i"))
+        self.assertTrue(inputs[3][0].startswith("-ss 63 -i"))
+        # Scene scores of the frames kept after the overlap line up
+        # with the timeline from the start of each segment
+        text = ("frame:0    pts:1    pts_time:1\n"
+                "lavfi.scene_score=0.500000\n")
+        self.assertEqual([
+            maker._parse_scene_scores(text, offset)
+            for _, _, offset in inputs[1:]
+        ], [[[20, 0.5]], [[40, 0.5]], [[60, 0.5]]])
+
+
+class GroupTilesTestCase(unittest.TestCase):
+    """Test group tiles only check the thumbnails of changed groups."""
+    def test_can_limit_checks_to_changed_groups(self):
+        maker = make_maker(force=False, jobs=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            catalog_filename = os.path.join(tmp, "catalog.json")
+            catalog = LibraryCatalog()
+            assets = [
+                LibraryAsset(os.path.join(tmp, group, "v.mp4"))
+                for group in ["a", "b"]
+            ]
+            for asset in assets:
+                catalog.append(asset)
+            checked = []
+
+            def group_inputs(files):
+                checked.append(files)
+                return "digest"
+
+            with patch.object(maker, "_group_inputs", group_inputs), \
+                    patch.object(maker, "generate_tile_thumbnail_file"):
+                maker.update_group_tiles(catalog, catalog_filename)
+                self.assertEqual(len(checked), 2)
+                checked.clear()
+                maker.update_group_tiles(catalog, catalog_filename, {"b"})
+                self.assertEqual(checked, [[assets[1].tile_image_filename]])
@@ -0,0 +1,89 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+import tubize.libraryasset as T_LA
+import tubize.libraryrename as T_LR
+
+
+class LibraryRenameTestCase(unittest.TestCase):
+    """Test catalog videos are renamed as a transaction."""
+    def _library(self, root):
+        assets = []
+        for name in ["old_trip", "day_out"]:
+            asset = T_LA.LibraryAsset(os.path.join(root, "videos",
+                                                   f"{name}.mp4"))
+            os.makedirs(os.path.dirname(asset.filename), exist_ok=True)
+            os.makedirs(asset.preview_basedir, exist_ok=True)
+            for filename in [asset.filename] + asset.artifact_filenames:
+                with open(filename, "w") as test_file:
+                    test_file.write(f"{asset.scrub_image_uri}#xywh=0,0,1,1")
+            with open(asset.meta_filename, "w") as meta_file:
+                json.dump({"title": asset.attributes.title}, meta_file)
+            assets.append(asset)
+        catalog = {
+            "videos": {
+                "assets": [{
+                    "_": a.uri,
+                    "title": a.attributes.title,
+                    "description": a.attributes.description,
+                    "tags": a.attributes.keywords,
+                    "duration": 10,
+                    "size": 1
+                } for a in assets]
+            }
+        }
+        with open(os.path.join(root, "catalog.json"), "w") as cat_file:
+            json.dump(catalog, cat_file)
+        return self._files(root)
+
+    def test_can_rename_videos(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self._library(tmp)
+            renamer = T_LR.LibraryRename(tmp)
+            renamer.plan("old_", "new_")
+            renamer.apply()
+            asset = T_LA.LibraryAsset(os.path.join(tmp, "videos",
+                                                   "new_trip.mp4"))
+            for filename in [asset.filename, asset.meta_filename
+                             ] + asset.artifact_filenames:
+                self.assertTrue(os.path.exists(filename))
+            with open(asset.vtt_filename, "r") as vtt_file:
+                self.assertEqual(vtt_file.read(),
+                                 "new_trip.mp4.jpg#xywh=0,0,1,1")
+            with open(asset.meta_filename, "r") as meta_file:
+                self.assertEqual(json.load(meta_file)["title"], "New Trip")
+            with open(renamer.catalog_filename, "r") as cat_file:
+                group = json.load(cat_file)["videos"]
+            self.assertEqual([e["_"] for e in group["assets"]],
+                             ["videos/day_out", "videos/new_trip"])
+            self.assertEqual(group["assets"][1]["tags"], ["new", "trip"])
+            self.assertFalse(renamer.pending)
+
+    def test_can_rollback_interrupted_rename(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            before = self._library(tmp)
+            renamer = T_LR.LibraryRename(tmp)
+            renamer.plan("old_", "new_")
+            rename = os.rename
+            calls = []
+
+            def crash(source, destination):
+                calls.append(source)
+                if len(calls) > 4:
+                    raise OSError("crash")
+                rename(source, destination)
+
+            with patch.object(T_LR.os, "rename", side_effect=crash):
+                with self.assertRaises(OSError):
+                    renamer.apply()
+            self.assertTrue(renamer.pending)
+            with self.assertRaises(ValueError):
+                renamer.plan("day", "night")
+            renamer.rollback()
+            self.assertEqual(self._files(tmp), before)
+
+    def _files(self, root):
+        return sorted(os.path.relpath(os.path.join(p, f), root)
+                      for p, _, fs in os.walk(root) for f in fs)
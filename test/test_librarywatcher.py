@@ -0,0 +1,93 @@
+import os
+import time
+import tempfile
+import unittest
+from types import SimpleNamespace
+import tubize.librarywatcher as T_LW
+
+
+class LibraryWatcherTestCase(unittest.TestCase):
+    """Test the watcher only queues settled changes."""
+    def test_can_scan_for_settled_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            options = SimpleNamespace(poll_interval=1,
+                                      settle_time=5,
+                                      incremental=False)
+            watcher = T_LW.LibraryWatcher(SimpleNamespace(options=options),
+                                          tmp)
+            os.makedirs(os.path.join(tmp, "videos"))
+            old = os.path.join(tmp, "videos", "old.mp4")
+            new = os.path.join(tmp, "videos", "new.mp4")
+            for filename in [old, new]:
+                with open(filename, "wb") as video_file:
+                    video_file.write(b"0" * 10)
+            os.utime(old, (time.time() - 60, time.time() - 60))
+
+            changed, removed, settling = watcher.scan()
+            self.assertEqual([f for f, _ in changed], [old])
+            self.assertEqual(removed, [])
+            self.assertTrue(settling)
+
+            watcher.known.update(changed)
+            os.utime(new, (time.time() - 60, time.time() - 60))
+            os.remove(old)
+            changed, removed, settling = watcher.scan()
+            self.assertEqual([f for f, _ in changed], [new])
+            self.assertEqual(removed, [old])
+            self.assertFalse(settling)
+            self.assertTrue(options.incremental)
+
+    def test_can_scan_changed_directories(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            options = SimpleNamespace(poll_interval=1,
+                                      settle_time=0,
+                                      incremental=False)
+            watcher = T_LW.LibraryWatcher(SimpleNamespace(options=options),
+                                          tmp)
+            for name in ["a", "b"]:
+                os.makedirs(os.path.join(tmp, name))
+            a_video = os.path.join(tmp, "a", "x.mp4")
+            b_video = os.path.join(tmp, "b", "y.mp4")
+            watcher.known[b_video] = {"mtime": 0}
+            with open(a_video, "wb") as video_file:
+                video_file.write(b"0" * 10)
+
+            a_dir = os.path.join(tmp, "a")
+            changed, removed, _ = watcher.scan({a_dir: False})
+            self.assertEqual([f for f, _ in changed], [a_video])
+            self.assertEqual(removed, [])
+            changed, removed, _ = watcher.scan({os.path.join(tmp, "b"): True})
+            self.assertEqual(changed, [])
+            self.assertEqual(removed, [b_video])
+
+    def test_can_retry_failed_videos(self):
+        catalogs = []
+
+        def add_video(filename):
+            if filename.endswith("bad.mp4"):
+                raise FileNotFoundError(filename)
+            return SimpleNamespace(filename=filename, updated=True)
+
+        def create_catalog(_, assets, groups=None):
+            catalogs.append((assets, groups))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            options = SimpleNamespace(poll_interval=1,
+                                      settle_time=0,
+                                      incremental=False,
+                                      jobs=1,
+                                      metrics_out=None)
+            maker = SimpleNamespace(
+                options=options,
+                add_video=add_video,
+                create_catalog=create_catalog)
+            watcher = T_LW.LibraryWatcher(maker, tmp)
+            good = os.path.join(tmp, "good.mp4")
+            bad = os.path.join(tmp, "bad.mp4")
+            failed = watcher.apply([(good, {"mtime": 1}),
+                                    (bad, {"mtime": 1})], [])
+            self.assertEqual(failed, [bad])
+            self.assertEqual(list(watcher.known), [good])
+            assets, groups = catalogs[-1]
+            self.assertEqual([a.filename for a in assets], [good])
+            self.assertEqual(groups, {os.path.basename(tmp)})
@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import unittest
+import tubize.metrics as T_M
+import tubize.utils as T_U
+
+
+class MetricsTestCase(unittest.TestCase):
+    """Test spans are recorded and exported."""
+    def test_can_export_spans(self):
+        T_M.collect()
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "out.txt")
+            with T_M.span("video", video="a.mp4"):
+                with T_M.span("thumbnail", outputs=[output], video="a.mp4"):
+                    with open(output, "w") as output_file:
+                        output_file.write("1234")
+            summary = T_M.summary()
+            self.assertEqual(summary["videos"], 1)
+            self.assertEqual(
+                summary["stages"]["stage:thumbnail"]["bytes_written"], 4)
+            trace_filename = os.path.join(tmp, "trace.json")
+            T_M.write_trace(trace_filename)
+            with open(trace_filename) as trace_file:
+                events = json.load(trace_file)["traceEvents"]
+            self.assertEqual([e["name"] for e in events],
+                             ["thumbnail", "video"])
+            self.assertTrue(all(e["ph"] == "X" for e in events))
+        self.assertEqual(len(T_M.collect()), 2)
+
+    def test_can_time_lazy_iteration(self):
+        T_M.collect()
+
+        def slow_items():
+            for i in range(2):
+                time.sleep(0.1)
+                yield i
+
+        for _ in T_M.timed("discover", slow_items(), path="p"):
+            time.sleep(0.3)
+        spans = T_M.collect()
+        self.assertEqual([s["name"] for s in spans], ["discover"])
+        self.assertEqual(spans[0]["args"], {"path": "p", "items": 2})
+        self.assertGreaterEqual(spans[0]["wall_time"], 0.2)
+        self.assertLess(spans[0]["wall_time"], 0.5)
+
+    def test_can_record_peak_memory(self):
+        T_M.collect()
+        with T_M.span("stage"):
+            T_U.call_sync(f'"{sys.executable}" -c "x = bytearray(64 << 20)"')
+        command, stage = T_M.collect()
+        for record in [command, stage]:
+            self.assertGreaterEqual(record["peak_rss_kb"], 0)
+            self.assertGreaterEqual(record["rss_growth_kb"], 0)
+        if T_M.resource:
+            # The command's own peak, not the lifetime high water mark
+            self.assertGreaterEqual(command["peak_rss_kb"], 64 << 10)
+            self.assertGreaterEqual(stage["peak_rss_kb"],
+                                    command["peak_rss_kb"])
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import cv2
+import tubize.mosaic as T_M
+
+
+class MosaicTestCase(unittest.TestCase):
+    """Test group mosaics are composed from cached reduced thumbnails."""
+    def test_can_write_mosaic(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for i in range(5):
+                filename = os.path.join(tmp, f"{i}.jpg")
+                image = np.full((180, 320, 3), 50 * i, dtype=np.uint8)
+                cv2.imencode(".jpg", image)[1].tofile(filename)
+                files.append(filename)
+            output_filename = os.path.join(tmp, "group.jpg")
+            cache = T_M.ThumbnailCache()
+            with patch.object(T_M, "decode_reduced",
+                              wraps=T_M.decode_reduced) as decode:
+                self.assertTrue(
+                    T_M.write_mosaic(files, output_filename, cache, 320))
+                self.assertTrue(
+                    T_M.write_mosaic(files, output_filename, cache, 320))
+                self.assertEqual(decode.call_count, 4)
+            mosaic = cv2.imread(output_filename)
+            self.assertEqual(mosaic.shape, (200, 350, 3))
+            # 2x2 grid of 175x100 cells, the first black and fourth 150
+            self.assertLess(mosaic[2, 87].max(), 10)
+            self.assertAlmostEqual(int(mosaic[150, 262, 0]), 150, delta=5)
+            self.assertFalse(T_M.write_mosaic([], output_filename, cache))
@@ -0,0 +1,152 @@
+import os
+import gzip
+import sys
+import time
+import asyncio
+import concurrent.futures
+import subprocess
+import tempfile
+import unittest
+import tubize.utils as T_U
+
+PYTHON = f'"{sys.executable}" -c'
+
+
+class CallTestCase(unittest.TestCase):
+    """Test system commands can be run concurrently."""
+    def test_can_capture_call_result(self):
+        result = T_U.call_sync(
+            f'{PYTHON} "import sys; print(1); sys.stderr.write(\'err\'); sys.exit(3)"'
+        )
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stdout.strip(), "1")
+        self.assertEqual(result.stderr, "err")
+        self.assertGreater(result.wall_time, 0)
+        with self.assertRaises(subprocess.CalledProcessError):
+            T_U.call_sync(f'{PYTHON} "import sys; sys.exit(1)"', check=True)
+
+    def test_can_timeout_call(self):
+        start = time.time()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            T_U.call_sync(f'{PYTHON} "import time; time.sleep(10)"',
+                          timeout=0.5)
+        self.assertLess(time.time() - start, 5)
+        stdout, _, _ = T_U.call(f'{PYTHON} "import time; time.sleep(10)"',
+                                timeout=0.5)
+        self.assertEqual(stdout, "")
+        stdout, stderr, _ = T_U.call("tubize-missing-command")
+        self.assertEqual(stdout, "")
+        self.assertTrue(stderr)
+
+    def test_can_limit_calls_across_threads(self):
+        previous = T_U.set_call_limit(1)
+        try:
+            start = time.time()
+            with concurrent.futures.ThreadPoolExecutor(2) as executor:
+                list(
+                    executor.map(T_U.call, [
+                        f'{PYTHON} "import time; time.sleep(0.5)"'
+                    ] * 2))
+            self.assertGreaterEqual(time.time() - start, 1.0)
+        finally:
+            T_U.set_call_limit(previous)
+
+    def test_can_limit_concurrent_calls(self):
+        previous = T_U.set_call_limit(2)
+        try:
+            start = time.time()
+            results = T_U.call_many(
+                [f'{PYTHON} "import time; time.sleep(0.5)"'] * 4)
+            self.assertGreaterEqual(time.time() - start, 1.0)
+            self.assertEqual([r.returncode for r in results], [0] * 4)
+        finally:
+            T_U.set_call_limit(previous)
+
+    def test_can_pack_calls_by_threads(self):
+        previous = T_U.set_call_limit(2)
+        try:
+            start = time.time()
+            T_U.call_many([f'{PYTHON} "import time; time.sleep(0.5)"'] * 2,
+                          threads=2)
+            self.assertGreaterEqual(time.time() - start, 1.0)
+            start = time.time()
+            T_U.call_many([f'{PYTHON} "import time; time.sleep(0.5)"'] * 2,
+                          threads=1)
+            self.assertLess(time.time() - start, 1.0)
+        finally:
+            T_U.set_call_limit(previous)
+
+    def test_can_budget_profile_threads(self):
+        previous_limit = T_U.set_call_limit(4)
+        previous = T_U.set_thread_profiles(
+            T_U.parse_thread_profiles("decode=8,encode=1"))
+        try:
+            self.assertEqual(T_U.profile_threads("decode"), 4)
+            self.assertEqual(T_U.profile_threads("encode"), 1)
+            self.assertEqual(T_U.profile_threads("transcode"), 4)
+            self.assertEqual(T_U.profile_threads("transcode", 3), 1)
+            args, threads = T_U.threaded_args(
+                '-ss 1 -i "a b.mp4" -ss 2 -i c.mp4 -f null -', "transcode")
+            self.assertEqual(args.count("-threads 2 -i"), 2)
+            self.assertIn("'a b.mp4'", args)
+            self.assertEqual(threads, 4)
+            args, threads = T_U.threaded_args(" -i a.mp4" * 8, "decode")
+            self.assertEqual(args.count("-threads 1 -i"), 8)
+            self.assertEqual(threads, 8)
+            with self.assertRaises(ValueError):
+                T_U.parse_thread_profiles("render=2")
+        finally:
+            T_U.set_thread_profiles(previous)
+            T_U.set_call_limit(previous_limit)
+
+    def test_can_call_from_event_loop(self):
+        result = asyncio.run(T_U.call_async(f'{PYTHON} "print(2)"'))
+        self.assertEqual(result.stdout.strip(), "2")
+
+
+class WalkFilesTestCase(unittest.TestCase):
+    """Test videos are found in path order without hidden folders."""
+    def test_can_walk_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in [
+                    "b.mp4", "a/z.mp4", "a/.preview/a.mp4", ".hidden/c.mp4",
+                    "a/c/d.mp4", ".e.mp4", "f.txt"
+            ]:
+                filename = os.path.join(tmp, name)
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                open(filename, "w").close()
+            found = [
+                os.path.relpath(f, tmp) for f in T_U.walk_files(tmp, "mp4")
+            ]
+        self.assertEqual(
+            found, [os.path.join("a", "c", "d.mp4"),
+                    os.path.join("a", "z.mp4"), "b.mp4"])
+
+
+class FingerprintTestCase(unittest.TestCase):
+    """Test content fingerprints ignore the path but not the content."""
+    def test_can_fingerprint_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            names = [os.path.join(tmp, n) for n in ["a", "b", "c"]]
+            for name, middle in zip(names, [b"1", b"1", b"2"]):
+                with open(name, "wb") as test_file:
+                    test_file.write(b"0" * 200000 + middle + b"0" * 200000)
+            prints = [T_U.file_fingerprint(n) for n in names]
+        self.assertEqual(prints[0], prints[1])
+        self.assertNotEqual(prints[0], prints[2])
+
+
+class PrecompressTestCase(unittest.TestCase):
+    """Test compressed variants are only written when the file changed."""
+    def test_can_precompress_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "catalog.json")
+            T_U.write_atomic(filename, T_U.dump_json({"a": [1, 2]}, True))
+            self.assertEqual(T_U.precompress(filename),
+                             len(T_U.compressors()))
+            with gzip.open(f"{filename}.gz", "rt") as gz_file:
+                self.assertEqual(gz_file.read(), '{"a":[1,2]}')
+            self.assertEqual(T_U.precompress(filename), 0)
+            os.utime(filename, (time.time() + 10, time.time() + 10))
+            self.assertEqual(T_U.precompress(filename),
+                             len(T_U.compressors()))
@@ -1,7 +1,12 @@
 """Tests for attrs library in attr_overlay.py."""
 
+import os
+import json
+import tempfile
 import unittest
+from unittest.mock import patch
 import tubize.libraryasset as T_LA
+import tubize.utils as T_U
 import tubize.videometainfo as T_VMI
 
 
@@ -14,3 +19,60 @@ class VideoMetaInfoTestCase(unittest.TestCase):
         self.assertEqual(obj_.fps, 30)
         self.assertEqual(obj_.width, 1920)
         self.assertEqual(obj_.height, 1080)
+
+    def test_can_load_meta_info_from_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "cached.mp4")
+            cache_filename = filename + ".json"
+            with open(filename, "wb") as video_file:
+                video_file.write(b"0" * 64)
+            props = T_VMI.Prop(fps=25.0,
+                               frames=250,
+                               height=720,
+                               width=1280,
+                               aspect_ratio="16:9",
+                               original_date="2019-11-10")
+            with open(cache_filename, "w") as cache_file:
+                json.dump(
+                    {
+                        "source": T_U.file_signature(filename),
+                        "fingerprint": T_U.file_fingerprint(filename),
+                        "properties": props._asdict()
+                    }, cache_file)
+            with patch.object(T_VMI, "call", side_effect=AssertionError):
+                obj_ = T_VMI.VideoMetaInfo(filename, cache_filename)
+                self.assertTrue(obj_.load_cache())
+                self.assertEqual(obj_.width, 1280)
+                self.assertEqual(obj_.duration, 10)
+            with open(filename, "ab") as video_file:
+                video_file.write(b"0")
+            obj_ = T_VMI.VideoMetaInfo(filename, cache_filename)
+            self.assertFalse(obj_.load_cache())
+
+    def test_can_parse_probe_with_missing_fields(self):
+        probe = {
+            "streams": [{
+                "width": 1920,
+                "height": 1080,
+                "r_frame_rate": "30000/1001",
+                "nb_frames": "N/A",
+                "display_aspect_ratio": "0:1"
+            }],
+            "format": {
+                "duration": "10.5",
+                "tags": {
+                    "creation_time": "2019-11-10T09:30:00.000000Z"
+                }
+            }
+        }
+        with patch.object(T_VMI, "call", return_value=(json.dumps(probe),
+                                                       None, 0)) as call:
+            obj_ = T_VMI.VideoMetaInfo("./missing.mp4")
+            self.assertEqual(obj_.fps, 29.97)
+            self.assertEqual(obj_.frames, 314)
+            self.assertEqual(obj_.duration, 10)
+            self.assertEqual(obj_.aspect_ratio, "16:9")
+            self.assertEqual(obj_.original_date, "2019-11-10")
+            self.assertEqual(call.call_count, 1)
+        props = T_VMI.parse_probe({})
+        self.assertEqual((props.width, props.height, props.fps), (100, 100, 30))